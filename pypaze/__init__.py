@@ -1,4 +1,7 @@
 from .app import create_app
+from .asgi import create_asgi_app
+from .cache import purge_cache
+from .routetree import RouteConflictError
 from .cli import cli
 
-__all__ = ["create_app", "cli"]
+__all__ = ["create_app", "create_asgi_app", "purge_cache", "RouteConflictError", "cli"]
@@ -0,0 +1,139 @@
+import atexit
+import json
+import queue
+import random
+import sys
+import threading
+import time
+from flask import g, request
+from .process import PerProcess
+
+
+class AccessLog(PerProcess):
+    """Buffered access log written by a background thread.
+
+    Requests only put a record on an in-memory queue; a writer thread
+    drains it in batches. If the queue is full the record is dropped and
+    counted rather than making the request wait on the log.
+    """
+
+    def __init__(self, stream=None, format="text", sample_rate=1.0, batch_size=256,
+                 flush_interval=1.0, max_queue=10000):
+        self.stream = stream or sys.stdout
+        self.format = format
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def _start_process(self):
+        self._queue = queue.Queue(self.max_queue)
+        self._thread = threading.Thread(target=self._run, name="pypaze-access-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def log(self, record):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            # A flush request (an Event) ends the batch early
+            while len(batch) < self.batch_size and not isinstance(batch[-1], threading.Event):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            records = [record for record in batch if not isinstance(record, threading.Event)]
+            try:
+                if records:
+                    self._write(records)
+            finally:
+                for record in batch:
+                    if isinstance(record, threading.Event):
+                        record.set()
+
+    def _write(self, batch):
+        if self.format == "json":
+            lines = [json.dumps(record, separators=(",", ":")) for record in batch]
+        else:
+            lines = [
+                f"{r['remote_addr']} {r['method']} {r['path']} {r['status']} "
+                f"{r['bytes'] if r['bytes'] is not None else '-'}B {r['duration_ms']}ms rule={r['rule'] or '-'}"
+                for r in batch
+            ]
+        self.stream.write("\n".join(lines) + "\n")
+        self.stream.flush()
+
+    def flush(self, timeout=5.0):
+        """Write out everything logged so far in this process, including the writer's current batch."""
+        if not self._started():
+            return
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            pass
+        else:
+            if done.wait(timeout):
+                return
+        # The writer is stuck or gone; write what is still queued ourselves
+        batch = []
+        while True:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if not isinstance(record, threading.Event):
+                batch.append(record)
+        if batch:
+            self._write(batch)
+
+
+def install_access_log(app, access_log):
+    """Log every sampled request through access_log once its response is sent."""
+    app.extensions["pypaze.access_log"] = access_log
+    if "pypaze.lifecycle" in app.extensions:
+        # Workers exit without running atexit handlers
+        app.extensions["pypaze.lifecycle"].on("shutdown", lambda app: access_log.flush())
+
+    @app.before_request
+    def start_access_log():
+        if access_log.sampled():
+            g._pypaze_access_start = time.perf_counter()
+
+    @app.after_request
+    def record_access_log(response):
+        start = g.pop("_pypaze_access_start", None)
+        if start is None:
+            return response
+        record = {
+            "time": time.time(),
+            "remote_addr": request.remote_addr,
+            "method": request.method,
+            "path": request.path,
+            "rule": request.url_rule.rule if request.url_rule else None,
+            "status": response.status_code,
+            "bytes": response.calculate_content_length(),
+        }
+
+        def finish():
+            record["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            access_log.log(record)
+
+        # Runs once the server has finished sending the body
+        response.call_on_close(finish)
+        return response
@@ -0,0 +1,204 @@
+import asyncio
+import inspect
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, request
+
+
+class TokenBucket:
+    """Token buckets refilled at ``rate`` per second, holding up to ``burst`` tokens each.
+
+    Only the ``max_keys`` most recently used keys are tracked.
+    """
+
+    def __init__(self, rate, burst=None, max_keys=10000):
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """Take a token for key; return 0, or the seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / self.rate
+            self._buckets[key] = (tokens - 1 if wait == 0 else tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class Limiter:
+    """Admission limits for the whole app or one route.
+
+    At most ``max_in_flight`` requests run at once; up to ``max_queue`` more
+    wait up to ``queue_timeout`` seconds for a slot, and the rest are
+    rejected straight away. ``rate`` and ``burst`` add a token bucket per
+    ``key``: "client" (remote address), "route", or a function of the
+    request.
+    """
+
+    def __init__(self, max_in_flight=None, max_queue=0, queue_timeout=1.0, rate=None, burst=None,
+                 key="client", retry_after=1):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.key = key
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def bucket_key(self, rule):
+        if callable(self.key):
+            return self.key(request)
+        return rule if self.key == "route" else request.remote_addr
+
+    def _try(self):
+        """Take a slot if one is free; return None, "queue" to wait, or a rejection reason."""
+        if self.max_in_flight is None or self.in_flight < self.max_in_flight:
+            self.in_flight += 1
+            return None
+        if self.waiting >= self.max_queue:
+            return "queue_full"
+        return "queue"
+
+    def acquire(self):
+        """Return None once a slot is held, else the reason the request was rejected."""
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            outcome = self._try()
+            if outcome != "queue":
+                return outcome
+            self.waiting += 1
+            try:
+                while self.in_flight >= self.max_in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return "queue_timeout"
+                    self._cond.wait(remaining)
+                self.in_flight += 1
+                return None
+            finally:
+                self.waiting -= 1
+
+    async def acquire_async(self):
+        # Waiting on the condition would block the event loop, so poll instead
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            outcome = self._try()
+            if outcome != "queue":
+                return outcome
+            self.waiting += 1
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return "queue_timeout"
+                await asyncio.sleep(min(0.005, remaining))
+                with self._cond:
+                    if self.in_flight < self.max_in_flight:
+                        self.in_flight += 1
+                        return None
+        finally:
+            with self._cond:
+                self.waiting -= 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+
+class Admission:
+    """App-wide admission control and the count of rejected requests."""
+
+    def __init__(self, limiter=None):
+        self.limiter = limiter
+        self.rejected = {}
+        self._lock = threading.Lock()
+
+    def reject(self, rule, reason, status, retry_after):
+        with self._lock:
+            self.rejected[(rule, reason)] = self.rejected.get((rule, reason), 0) + 1
+        response = current_app.response_class(
+            '{"error": "Service Unavailable"}\n' if status == 503 else '{"error": "Too Many Requests"}\n',
+            status=status, mimetype="application/json",
+        )
+        response.headers["Retry-After"] = str(retry_after)
+        return response
+
+
+def _limiter(options):
+    if options is None or isinstance(options, Limiter):
+        return options
+    return Limiter(**options)
+
+
+def admission_view(admission, view, rule, options=None):
+    """Apply the route's and the app's admission limits to view.
+
+    Rate limits are checked first and answered with 429; requests that find
+    no free slot and no room in the queue, or wait past the queue timeout,
+    get a 503. Both carry Retry-After.
+    """
+    limiters = [limiter for limiter in (_limiter(options), admission.limiter) if limiter is not None]
+
+    def rate_limited():
+        for limiter in limiters:
+            if limiter.bucket is not None:
+                wait = limiter.bucket.take(limiter.bucket_key(rule))
+                if wait:
+                    return admission.reject(rule, "rate_limited", 429, math.ceil(wait))
+        return None
+
+    if inspect.iscoroutinefunction(view):
+        async def admitted(*args, **kwargs):
+            rejected = rate_limited()
+            if rejected is not None:
+                return rejected
+            held = []
+            try:
+                for limiter in limiters:
+                    reason = await limiter.acquire_async()
+                    if reason is not None:
+                        return admission.reject(rule, reason, 503, limiter.retry_after)
+                    held.append(limiter)
+                return await view(*args, **kwargs)
+            finally:
+                for limiter in held:
+                    limiter.release()
+        return admitted
+
+    def admitted(*args, **kwargs):
+        rejected = rate_limited()
+        if rejected is not None:
+            return rejected
+        held = []
+        try:
+            for limiter in limiters:
+                reason = limiter.acquire()
+                if reason is not None:
+                    return admission.reject(rule, reason, 503, limiter.retry_after)
+                held.append(limiter)
+            return view(*args, **kwargs)
+        finally:
+            for limiter in held:
+                limiter.release()
+    return admitted
+
+
+def install_admission(app, admission):
+    app.extensions["pypaze.admission"] = admission
+    metrics = app.extensions.get("pypaze.metrics")
+    if metrics is not None:
+        metrics.collectors.append(lambda: [
+            ("counters", "pypaze_requests_rejected_total", (("rule", rule), ("reason", reason)), count)
+            for (rule, reason), count in list(admission.rejected.items())
+        ])
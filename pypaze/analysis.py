@@ -0,0 +1,66 @@
+import ast
+
+
+def _top_level(body):
+    """Yield module-level statements, descending into if/try/with blocks."""
+    for node in body:
+        yield node
+        if isinstance(node, (ast.If, ast.Try, ast.With)):
+            for block in ("body", "orelse", "finalbody"):
+                yield from _top_level(getattr(node, block, []))
+            for handler in getattr(node, "handlers", []):
+                yield from _top_level(handler.body)
+
+
+def _targets(node):
+    if isinstance(node, ast.Assign):
+        return [t.id for t in node.targets if isinstance(t, ast.Name)]
+    if isinstance(node, (ast.AnnAssign, ast.AugAssign)) and isinstance(node.target, ast.Name):
+        return [node.target.id]
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return [node.name]
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        return [(alias.asname or alias.name).split(".")[0] for alias in node.names]
+    return []
+
+
+def module_names(source, filename="<route>"):
+    """Map each name bound at module level to the last statement binding it."""
+    names = {}
+    for node in _top_level(ast.parse(source, filename).body):
+        for name in _targets(node):
+            names[name] = node
+    return names
+
+
+def literal(node):
+    """Return the literal value assigned by node, or raise ValueError."""
+    value = getattr(node, "value", None)
+    if value is None or isinstance(node, ast.AugAssign):
+        raise ValueError("not a literal assignment")
+    return ast.literal_eval(value)
+
+
+def _reference(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = _reference(node.value)
+        return f"{base}.{node.attr}" if base else None
+    if isinstance(node, ast.Call):
+        name = _reference(node.func)
+        return f"{name}(...)" if name else None
+    return None
+
+
+def reference_names(node):
+    """Return the names listed by an assignment like ``middleware = [auth, log_request]``.
+
+    Attributes are dotted and calls such as ``rate_limit(10)`` shown as
+    ``rate_limit(...)``; any other item is "?". Raises ValueError unless a
+    list or tuple is assigned.
+    """
+    value = getattr(node, "value", None)
+    if not isinstance(value, (ast.List, ast.Tuple)) or isinstance(node, ast.AugAssign):
+        raise ValueError("not a list or tuple assignment")
+    return [_reference(item) or "?" for item in value.elts]
@@ -1,14 +1,44 @@
 from flask import Flask
-from .routing import register_routes
+from .routing import register_routes, warm_routes as _warm_routes
 from .middleware import apply_global_middleware
-from .utils import enable_hot_reload
+from . import utils
+from .manifest import default_manifest_path, load_manifest
+from .cache import ResponseCache
+from .metrics import Metrics, install_metrics
+from .assets import default_asset_dir, install_assets
+from .loaders import LoaderPool
+from .admission import Admission, Limiter, install_admission
+from .profiler import Profiler, default_profile_dir, install_profiler
+from .preload import Preloader, install_preload
+from .serialization import install_json
+from .tasks import TaskQueue, install_tasks
+from .hooks import install_lifecycle, on_app_init
+from .templates import compile_templates, configure_bytecode_cache, default_bytecode_dir
 import os
 
 def create_app(
     base_path="routes",
     static_folder="static",
     template_folder="templates",
-    enable_hot_reload=False
+    enable_hot_reload=False,
+    manifest=None,
+    lazy=False,
+    warm_routes=None,
+    cache_backend=None,
+    access_log=True,
+    metrics=False,
+    assets=None,
+    compress=False,
+    etag=False,
+    bytecode_cache=None,
+    warm_templates=False,
+    loader_threads=32,
+    admission=None,
+    profile=None,
+    json_provider=None,
+    tasks=None,
+    preload=False,
+    max_body_size=None,
 ):
     # Create the Flask app with explicit static and template folder paths
     app = Flask(
@@ -17,21 +47,117 @@ def create_app(
         template_folder=os.path.abspath(template_folder),
     )
 
-    # Dynamically register routes from the base_path
-    register_routes(app, base_path=os.path.abspath(base_path))
+    # Encode JSON responses with orjson when it's installed; pass a Flask
+    # JSONProvider subclass to use another (json_provider=False keeps Flask's)
+    if json_provider is not False:
+        install_json(app, json_provider)
+
+    # Default request body limit; route modules set their own with `max_body_size`
+    if max_body_size:
+        app.config["MAX_CONTENT_LENGTH"] = max_body_size
+
+    # Startup, post-fork, teardown and shutdown hooks plus per-process
+    # resources, including those declared in routes/_lifecycle.py
+    lifecycle = install_lifecycle(app)
+    lifecycle.load(os.path.abspath(base_path))
+
+    # Keep compiled templates on disk so fresh workers don't recompile them
+    # (bytecode_cache=False disables it)
+    if bytecode_cache is not False:
+        configure_bytecode_cache(app, bytecode_cache or default_bytecode_dir(template_folder))
+
+    # Serve the fingerprinted assets written by `pypaze build` when there are
+    # any (assets=False keeps serving static_folder as is). Hot reload serves
+    # the live files, since a build would go stale with the first edit
+    if assets is not False and not enable_hot_reload:
+        install_assets(app, assets or default_asset_dir(static_folder))
+
+    # Link preload headers and 103 Early Hints for the stylesheets, scripts
+    # and fonts a route's pages reference
+    if preload:
+        if isinstance(preload, dict):
+            preload = Preloader(**preload)
+        elif not isinstance(preload, Preloader):
+            preload = Preloader()
+        install_preload(app, preload)
+
+    # Shared response cache for routes that declare `cache = {...}`
+    app.extensions["pypaze.cache"] = ResponseCache(cache_backend)
+
+    # Threads that run route modules' `loaders` concurrently
+    app.extensions["pypaze.loaders"] = LoaderPool(loader_threads)
+
+    # Strong ETags computed from the body of every file route response
+    # (a route module opts out with `etag = False`)
+    app.extensions["pypaze.auto_etag"] = etag
+
+    # Opt-in latency histograms for every file route, served in Prometheus format
+    if metrics:
+        if isinstance(metrics, dict):
+            metrics = Metrics(**metrics)
+        elif not isinstance(metrics, Metrics):
+            metrics = Metrics()
+        install_metrics(app, metrics)
+
+    # Admission control: app-wide limits from `admission`, per-route limits
+    # from a module's `admission` attribute
+    if isinstance(admission, dict):
+        admission = Limiter(**admission)
+    install_admission(app, Admission(admission))
+
+    # Worker pool for work handlers hand off with defer()
+    if isinstance(tasks, dict):
+        tasks = TaskQueue(**tasks)
+    install_tasks(app, tasks or TaskQueue())
+
+    # On-demand profiling; routes aren't wrapped at all unless it's enabled
+    if profile:
+        if isinstance(profile, dict):
+            profile = Profiler(**profile)
+        elif not isinstance(profile, Profiler):
+            profile = Profiler()
+        if profile.output_dir is None:
+            profile.output_dir = default_profile_dir(base_path)
+        install_profiler(app, profile)
+
+    # Dynamically register routes from the base_path, reusing the manifest
+    # written by `pypaze build` when there is one (manifest=False disables it)
+    manifest_path = None
+    if manifest is not False:
+        manifest_path = manifest or default_manifest_path(base_path)
+    register_routes(
+        app,
+        base_path=os.path.abspath(base_path),
+        manifest=load_manifest(manifest_path) if manifest_path else None,
+        manifest_path=manifest_path,
+        lazy=lazy,
+    )
+
+    # In lazy mode route modules load on first request; warm the listed ones now
+    if lazy and warm_routes:
+        _warm_routes(app, warm_routes)
+
+    # Compile every template now rather than on each one's first render
+    if warm_templates:
+        compile_templates(app)
 
     # Apply global middleware
-    apply_global_middleware(app)
+    apply_global_middleware(app, access_log=access_log, compress=compress)
 
     # Enable hot reloading (if requested)
     if enable_hot_reload:
-        enable_hot_reload(app, watch_path=base_path)
+        utils.enable_hot_reload(app, watch_path=os.path.abspath(base_path), lazy=lazy)
 
     # Add a default 404 handler
     @app.errorhandler(404)
     def page_not_found(e):
         return {"error": "Not Found"}, 404
 
+    # Bodies over a route's max_body_size
+    @app.errorhandler(413)
+    def payload_too_large(e):
+        return {"error": "Payload Too Large"}, 413
+
     # Add a 500 error handler with template-specific debugging
     @app.errorhandler(500)
     def server_error(e):
@@ -40,4 +166,6 @@ def create_app(
             return {"error": f"Template '{e.original_exception.name}' not found"}, 500
         return {"error": "Internal Server Error"}, 500
 
+    on_app_init(app)
+
     return app
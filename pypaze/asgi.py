@@ -0,0 +1,256 @@
+import asyncio
+import io
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from flask import request_started
+from werkzeug.exceptions import HTTPException
+from .app import create_app
+
+# Request bodies larger than this are spooled to a temporary file
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope into a WSGI environ."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        # Bodies without a Content-Length end where the stream does
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+        "asgi.scope": scope,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+class ReceiveStream(io.RawIOBase):
+    """``wsgi.input`` that pulls the body from ASGI receive() as the app reads it.
+
+    Reads block on the event loop, so this is only for apps running on a
+    pool thread.
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = bytearray()
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def _more(self):
+        message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+        if message["type"] == "http.disconnect":
+            self._done = True
+            return
+        self._buffer += message.get("body", b"")
+        self._done = not message.get("more_body", False)
+
+    def read(self, size=-1):
+        while not self._done and (size is None or size < 0 or len(self._buffer) < size):
+            self._more()
+        if size is None or size < 0:
+            size = len(self._buffer)
+        chunk = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return chunk
+
+    def readinto(self, buffer):
+        chunk = self.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+class ASGIApp:
+    """Serve a pypaze Flask app over ASGI.
+
+    Routes whose handler is ``async def`` are awaited on the event loop.
+    Everything else, including sync routes, static files and errors, runs
+    through the regular WSGI app on a bounded thread pool and reads the
+    request body from the client as it goes. Async routes get their body
+    spooled up front, after a Content-Length over the route's
+    ``max_body_size`` has been turned away unread.
+    """
+
+    def __init__(self, app, max_threads=None):
+        self.app = app
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_threads or min(32, (os.cpu_count() or 1) + 4),
+            thread_name_prefix="pypaze-asgi",
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+        environ = build_environ(scope, None)
+        view = await self._async_view(environ)
+        if view is None:
+            environ["wsgi.input"] = ReceiveStream(receive, asyncio.get_running_loop())
+            await self._run_wsgi(environ, send)
+        else:
+            environ["wsgi.input"] = await self._read_body(receive, environ, self._body_limit(view))
+            await self._run_async(view, environ, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _body_limit(self, view):
+        return getattr(view.module, "max_body_size", None) or self.app.config.get("MAX_CONTENT_LENGTH")
+
+    async def _read_body(self, receive, environ, limit=None):
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        if limit and int(environ.get("CONTENT_LENGTH") or 0) > limit:
+            # The view answers 413 from the header alone
+            return body
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunk = message.get("body", b"")
+            body.write(chunk)
+            size += len(chunk)
+            more_body = message.get("more_body", False)
+            if limit and size > limit:
+                # Enough to know it's too big; the view raises 413 when it reads past the limit
+                break
+        body.seek(0)
+        return body
+
+    async def _async_view(self, environ):
+        """Return the RouteView for environ if its handler is async."""
+        try:
+            rule, _ = self.app.url_map.bind_to_environ(environ).match(return_rule=True)
+        except HTTPException:
+            return None
+        view = self.app.extensions.get("pypaze.routes", {}).get(rule.endpoint)
+        if view is None:
+            return None
+        if view.view is None:
+            await asyncio.get_running_loop().run_in_executor(self.executor, view.load)
+        return view if view.is_async else None
+
+    async def _run_async(self, view, environ, send):
+        # Mirrors Flask.wsgi_app and full_dispatch_request, awaiting the view
+        app = self.app
+        ctx = app.request_context(environ)
+        error = None
+        try:
+            try:
+                ctx.push()
+                app._got_first_request = True
+                try:
+                    request_started.send(app, _async_wrapper=app.ensure_sync)
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        req = ctx.request
+                        if req.routing_exception is not None:
+                            app.raise_routing_exception(req)
+                        if getattr(req.url_rule, "provide_automatic_options", False) and req.method == "OPTIONS":
+                            rv = app.make_default_options_response()
+                        else:
+                            rv = await view.call_async(**req.view_args)
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.finalize_request(rv)
+            except Exception as e:
+                error = e
+                response = app.handle_exception(e)
+            app_iter, status, headers = response.get_wsgi_response(environ)
+            streamed = response.is_streamed
+        finally:
+            if error is not None and app.should_ignore_error(error):
+                error = None
+            ctx.pop(error)
+
+        started = {"status": status, "headers": headers, "sent": False}
+        if streamed:
+            # Streamed bodies may block while producing chunks, so iterate off-loop
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self._iterate, loop, send, started, lambda: app_iter)
+        else:
+            try:
+                for chunk in app_iter:
+                    await self._send_body(send, started, chunk, True)
+            finally:
+                if hasattr(app_iter, "close"):
+                    app_iter.close()
+        await self._send_body(send, started, b"", False)
+
+    async def _run_wsgi(self, environ, send):
+        started = {"sent": False}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"], started["headers"] = status, headers
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self.executor, self._iterate, loop, send, started, lambda: self.app(environ, start_response)
+        )
+        await self._send_body(send, started, b"", False)
+
+    def _iterate(self, loop, send, started, get_iter):
+        """Produce a WSGI body on a pool thread, sending each chunk as it comes."""
+        app_iter = get_iter()
+        try:
+            for chunk in app_iter:
+                if chunk:
+                    asyncio.run_coroutine_threadsafe(self._send_body(send, started, chunk, True), loop).result()
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+
+    async def _send_body(self, send, started, chunk, more_body):
+        if not started["sent"]:
+            started["sent"] = True
+            await send({
+                "type": "http.response.start",
+                "status": int(str(started["status"]).split(" ", 1)[0]),
+                "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in started["headers"]],
+            })
+        if chunk or not more_body:
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+
+def create_asgi_app(max_threads=None, **options):
+    """Create a pypaze app wrapped for ASGI servers such as uvicorn.
+
+    ``options`` are passed to create_app; max_threads bounds the pool that
+    runs sync handlers.
+    """
+    return ASGIApp(create_app(**options), max_threads=max_threads)
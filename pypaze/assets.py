@@ -0,0 +1,140 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from flask import request, send_from_directory
+from .manifest import BUILD_DIR
+
+# Fingerprinted files never change under their name, so clients may keep them for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE_TYPES = (
+    "application/javascript", "application/json", "application/xml", "application/wasm",
+    "image/svg+xml", "font/ttf", "font/otf",
+)
+MIN_COMPRESS_SIZE = 256
+
+
+def default_asset_dir(static_folder):
+    """Build output for a static folder: <project>/.pypaze/static."""
+    project = os.path.dirname(os.path.abspath(static_folder))
+    return os.path.join(project, BUILD_DIR, "static")
+
+
+def fingerprint(rel, digest):
+    """Insert a content hash before the extension: css/site.css -> css/site.<hash>.css."""
+    root, ext = os.path.splitext(rel)
+    return f"{root}.{digest[:12]}{ext}"
+
+
+def compressible(mimetype):
+    return bool(mimetype) and (mimetype.startswith("text/") or mimetype in COMPRESSIBLE_TYPES)
+
+
+def load_assets(asset_dir):
+    try:
+        with open(os.path.join(asset_dir, "assets.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_assets(static_folder, asset_dir=None):
+    """Copy every static file to a content-hashed name with a precompressed .gz sibling.
+
+    Writes ``assets.json`` mapping each original path to its fingerprinted
+    name. Files already built under the same hash are left alone, and only
+    the current and previous builds are kept so pages cached before a deploy
+    can still load their assets.
+    """
+    asset_dir = asset_dir or default_asset_dir(static_folder)
+    previous = load_assets(asset_dir) or {}
+    assets, stats = {}, {"written": 0, "unchanged": 0, "compressed": 0}
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for file in files:
+            source = os.path.join(root, file)
+            rel = os.path.relpath(source, static_folder).replace(os.sep, "/")
+            with open(source, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            mimetype = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+            asset = {"path": fingerprint(rel, digest), "etag": digest[:32], "mimetype": mimetype, "gzip": False}
+            target = os.path.join(asset_dir, asset["path"])
+
+            if os.path.exists(target):
+                asset["gzip"] = os.path.exists(target + ".gz")
+                stats["unchanged"] += 1
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(source, target)
+                stats["written"] += 1
+                if compressible(mimetype) and len(data) >= MIN_COMPRESS_SIZE:
+                    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+                    # Only worth serving if it actually saves bytes
+                    if len(compressed) < len(data):
+                        with open(target + ".gz", "wb") as f:
+                            f.write(compressed)
+                        asset["gzip"] = True
+                        stats["compressed"] += 1
+            assets[rel] = asset
+
+    keep = {a["path"] for a in assets.values()} | {a["path"] for a in previous.values()}
+    for root, _, files in os.walk(asset_dir):
+        for file in files:
+            rel = os.path.relpath(os.path.join(root, file), asset_dir).replace(os.sep, "/")
+            if rel != "assets.json" and rel not in keep and rel[:-3] not in keep:
+                os.remove(os.path.join(root, file))
+
+    os.makedirs(asset_dir, exist_ok=True)
+    tmp_path = os.path.join(asset_dir, f"assets.json.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(assets, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(asset_dir, "assets.json"))
+    stats["files"] = len(assets)
+    return stats
+
+
+def install_assets(app, asset_dir):
+    """Serve built assets under their fingerprinted names.
+
+    ``url_for('static', filename=...)`` resolves to the fingerprinted name,
+    which is served with an immutable Cache-Control, a strong ETag and the
+    gzip variant when the client accepts it. Files missing from the build
+    fall back to the static folder as before, and so does everything while
+    the app runs in debug mode, so edits to static files show up at once.
+    """
+    assets = load_assets(asset_dir)
+    if not assets or "static" not in app.view_functions:
+        return
+    app.extensions["pypaze.assets"] = {"dir": asset_dir, "assets": assets}
+    built = {asset["path"]: asset for asset in assets.values()}
+    send_static_file = app.view_functions["static"]
+
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint == "static" and not app.debug and values.get("filename") in assets:
+            values["filename"] = assets[values["filename"]]["path"]
+
+    def static(filename):
+        asset = None if app.debug else built.get(filename)
+        if asset is None:
+            return send_static_file(filename=filename)
+        gzipped = asset["gzip"] and request.accept_encodings["gzip"] > 0
+        response = send_from_directory(
+            asset_dir, filename + ".gz" if gzipped else filename,
+            mimetype=asset["mimetype"],
+            download_name=filename,
+            etag=asset["etag"] + ("-gz" if gzipped else ""),
+            max_age=IMMUTABLE_MAX_AGE,
+        )
+        if gzipped:
+            response.headers["Content-Encoding"] = "gzip"
+        if asset["gzip"]:
+            response.vary.add("Accept-Encoding")
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions["static"] = static
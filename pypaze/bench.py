@@ -0,0 +1,291 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from werkzeug.routing import Map, Rule
+from werkzeug.routing.converters import NumberConverter, PathConverter
+import pypaze
+from .app import create_app
+from .routetree import RouteTree
+from .routing import route_for_file
+
+# Metrics whose value should go up; every other metric is a cost
+HIGHER_IS_BETTER = (".rps",)
+
+STARTUP_SCRIPT = """
+import json, sys, time
+from pypaze import create_app
+from pypaze.server import rss_bytes
+before = rss_bytes()
+start = time.perf_counter()
+app = create_app(**json.loads(sys.argv[1]))
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "rss_mb": (rss_bytes() - before) / 2**20}))
+"""
+
+IMPORT_SCRIPT = """
+import json, os, sys, time
+import pypaze  # Flask and the framework itself aren't charged to the route
+from pypaze.hooks import Lifecycle
+from pypaze.routing import load_route_module, module_name_for_file
+from pypaze.server import rss_bytes
+base_path, relative_path = sys.argv[1:3]
+Lifecycle(None).load(base_path)
+path = os.path.join(base_path, relative_path)
+before = rss_bytes()
+start = time.perf_counter()
+load_route_module(path, module_name_for_file(path))
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "rss_kb": (rss_bytes() - before) / 1024}))
+"""
+
+HANDLERS = {
+    "text": 'def handler():\n    return "hello"\n',
+    "json": 'def handler():\n    return {"id": 1, "items": list(range(20))}\n',
+    "json_nulls": (
+        'def handler():\n'
+        '    return [{"id": i, "name": f"user{i}", "email": None, "score": i / 3} for i in range(200)]\n'
+    ),
+    "template": (
+        'from flask import render_template\n\n'
+        'def handler():\n    return render_template("page.html", items=range(20))\n'
+    ),
+    "async": 'async def handler():\n    return {"id": 1}\n',
+    "middleware": (
+        'def noop(request):\n    return None\n\n'
+        'middleware = [noop] * 5\n\n'
+        'def handler():\n    return "hello"\n'
+    ),
+}
+
+TEMPLATE = "<ul>{% for item in items %}<li>{{ item }}</li>{% endfor %}</ul>\n"
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def synthetic_routes(routes=100, depth=3):
+    """Yield (route file, sample URL path, kind) for a synthetic route tree.
+
+    ``routes`` static routes, ``routes`` ``[param]`` routes and
+    ``routes // 10`` catch-all routes, spread over nested directories.
+    """
+    for i in range(routes):
+        parts = [f"d{(i // 10 ** level) % 10}" for level in range(depth - 1)]
+        yield "/".join(parts + [f"page{i}.py"]), "/" + "/".join(parts + [f"page{i}"]), "static"
+        yield "/".join(parts + [f"item{i}", "[id].py"]), "/" + "/".join(parts + [f"item{i}", "42"]), "dynamic"
+    for i in range(max(1, routes // 10)):
+        yield f"files{i}/[...rest].py", f"/files{i}/a/b/c.txt", "catchall"
+
+
+def generate_tree(root, routes=100, depth=3):
+    """Write a synthetic project under root.
+
+    Creates the route files from synthetic_routes, one route per handler
+    type in HANDLERS, and a template. Returns sample URL paths for each
+    kind of route.
+    """
+    base = os.path.join(root, "routes")
+    samples = {"static": [], "dynamic": [], "catchall": []}
+    sources = {
+        "static": HANDLERS["text"],
+        "dynamic": 'def handler(id):\n    return id\n',
+        "catchall": 'def handler(rest):\n    return rest\n',
+    }
+    for rel, path, kind in synthetic_routes(routes, depth):
+        _write(os.path.join(base, rel), sources[kind])
+        samples[kind].append(path)
+    for kind, source in HANDLERS.items():
+        _write(os.path.join(base, "bench", f"{kind}.py"), source)
+    _write(os.path.join(root, "templates", "page.html"), TEMPLATE)
+    os.makedirs(os.path.join(root, "static"), exist_ok=True)
+    return samples
+
+
+def measure_scaling(sizes=(100, 1000, 10000), iterations=20000):
+    """Match latency per kind of route as the route tree grows.
+
+    Rules are compiled from synthetic route file names straight into a url
+    map, so 10k routes can be measured without writing and importing files.
+    """
+    results = {}
+    for size in sizes:
+        entries, samples = [], {"static": [], "dynamic": [], "catchall": []}
+        for rel, path, kind in synthetic_routes(size):
+            entries.append({"file": rel, "rule": route_for_file(rel), "endpoint": rel, "methods": ["GET"]})
+            samples[kind].append(path)
+        url_map = Map([Rule(e["rule"], endpoint=e["endpoint"]) for e in RouteTree(entries).ordered()])
+        # The same number of distinct paths at every size, so only the map changes
+        samples = {kind: paths[::max(1, len(paths) // 100)] for kind, paths in samples.items()}
+        results[size] = measure_matching(url_map, samples, iterations)
+    return results
+
+
+def sample_paths(app):
+    """Build one concrete URL path per GET rule of an existing app."""
+    samples = {"static": [], "dynamic": [], "catchall": []}
+    adapter = app.url_map.bind("localhost")
+    for endpoint, view in app.extensions.get("pypaze.routes", {}).items():
+        for rule in app.url_map.iter_rules(endpoint):
+            if "GET" not in rule.methods:
+                continue
+            values = {}
+            for name, converter in rule._converters.items():
+                if isinstance(converter, PathConverter):
+                    values[name] = "a/b"
+                else:
+                    values[name] = "1" if isinstance(converter, NumberConverter) else "x"
+            kind = "static" if not values else "catchall" if "a/b" in values.values() else "dynamic"
+            try:
+                samples[kind].append(adapter.build(endpoint, values))
+            except Exception:
+                pass
+    return samples
+
+
+def _env():
+    # Subprocesses import this copy of pypaze, installed or not
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [os.path.dirname(os.path.dirname(pypaze.__file__)), env.get("PYTHONPATH")])
+    )
+    return env
+
+
+def measure_startup(root, runs=3, **options):
+    """Median create_app time and memory, each run in a fresh interpreter."""
+    env = _env()
+    options = dict({"access_log": False}, **options)
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, json.dumps(options)],
+            cwd=root, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "seconds": statistics.median(r["seconds"] for r in results),
+        "rss_mb": statistics.median(r["rss_mb"] for r in results),
+    }
+
+
+def measure_import(base_path, relative_path, cwd=None):
+    """Time and memory to import one route file, in a fresh interpreter.
+
+    Returns {"seconds", "rss_kb"}, or {"error"} when the import fails.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT, os.path.abspath(base_path), relative_path],
+        cwd=cwd, env=_env(), capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit status {result.returncode}"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_imports(base_path, files, workers=None):
+    """measure_import for each of files, several interpreters at a time."""
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        return list(pool.map(partial(measure_import, base_path), files))
+
+
+def measure_matching(url_map, samples, iterations=20000):
+    """Average microseconds per url_map match for each kind of route."""
+    adapter = url_map.bind("localhost")
+    results = {}
+    for kind, paths in samples.items():
+        if not paths:
+            continue
+        n = max(iterations // len(paths), 1) * len(paths)
+        start = time.perf_counter()
+        for i in range(n):
+            adapter.match(paths[i % len(paths)])
+        results[kind] = (time.perf_counter() - start) / n * 1e6
+    return results
+
+
+def measure_requests(app, paths, requests=2000):
+    """Requests per second through the WSGI test client, per path."""
+    client = app.test_client()
+    results = {}
+    for name, path in paths.items():
+        client.get(path).close()
+        start = time.perf_counter()
+        for _ in range(requests):
+            client.get(path).close()
+        results[name] = requests / (time.perf_counter() - start)
+    return results
+
+
+def run_bench(routes=100, requests=2000, runs=3, app_dir=None, scaling=(100, 1000, 10000)):
+    """Run every benchmark and return a flat dict of results."""
+    results = {}
+    for size, kinds in measure_scaling(scaling).items():
+        for kind, us in kinds.items():
+            results[f"match.scaling.{size}.{kind}.us"] = us
+    with tempfile.TemporaryDirectory(prefix="pypaze-bench-") as tmp:
+        root = os.path.abspath(app_dir) if app_dir else tmp
+        if app_dir is None:
+            samples = generate_tree(root, routes=routes)
+
+        for mode, options in (("eager", {"manifest": False}), ("lazy", {"manifest": False, "lazy": True})):
+            for key, value in measure_startup(root, runs=runs, **options).items():
+                results[f"startup.{mode}.{key}"] = value
+
+        cwd = os.getcwd()
+        os.chdir(root)
+        try:
+            app = create_app(manifest=False, access_log=False)
+        finally:
+            os.chdir(cwd)
+        if app_dir is not None:
+            samples = sample_paths(app)
+        for kind, us in measure_matching(app.url_map, samples).items():
+            results[f"match.{kind}.us"] = us
+
+        if app_dir is None:
+            paths = {kind: f"/bench/{kind}" for kind in HANDLERS}
+        else:
+            paths = {path: path for path in samples["static"][:20]}
+        for name, rps in measure_requests(app, paths, requests=requests).items():
+            results[f"request.{name}.rps"] = rps
+        if "request.text.rps" in results and "request.middleware.rps" in results:
+            results["middleware.overhead.us"] = (
+                1e6 / results["request.middleware.rps"] - 1e6 / results["request.text.rps"]
+            )
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "routes": routes if app_dir is None else len(list(app.url_map.iter_rules())),
+            "requests": requests,
+            "app_dir": app_dir,
+            "time": time.time(),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=0.1):
+    """List (metric, baseline, current, change) for results that regressed by more than threshold."""
+    regressions = []
+    for key, value in current["results"].items():
+        old = baseline.get("results", {}).get(key)
+        if not old:
+            continue
+        change = (value - old) / old
+        if key.endswith(HIGHER_IS_BETTER):
+            change = -change
+        if change > threshold:
+            regressions.append((key, old, value, change))
+    return regressions
@@ -0,0 +1,130 @@
+import inspect
+import tempfile
+from flask import request
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+CHUNK_SIZE = 64 * 1024
+# Uploaded files are kept in memory up to this size, then moved to a temporary file
+SPOOL_SIZE = 1024 * 1024
+
+
+class RequestBody:
+    """The request body of a ``stream_body`` route, read as the handler goes.
+
+    Iterate over it for raw chunks, call ``read`` like a file, or iterate
+    over ``parts()`` for a multipart form.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, spool_size=SPOOL_SIZE):
+        self.chunk_size = chunk_size
+        self.spool_size = spool_size
+        self.content_length = request.content_length
+        self.mimetype = request.mimetype
+
+    def read(self, size=-1):
+        return request.stream.read(size)
+
+    def __iter__(self):
+        read = request.stream.read
+        while True:
+            chunk = read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def parts(self):
+        """Yield ``(name, value)`` for each part of a multipart/form-data body.
+
+        Fields are decoded to str and limited to the request's
+        ``max_form_memory_size``; files are FileStorage objects spooled to a
+        temporary file past ``spool_size`` bytes. Each part is yielded once
+        it has been read in full, before the next one is read.
+        """
+        if self.mimetype != "multipart/form-data":
+            raise BadRequest("Expected a multipart/form-data body")
+        boundary = parse_options_header(request.headers.get("Content-Type", ""))[1].get("boundary")
+        if not boundary:
+            raise BadRequest("Missing multipart boundary")
+        decoder = MultipartDecoder(
+            boundary.encode("latin-1"),
+            max_form_memory_size=request.max_form_memory_size,
+            max_parts=request.max_form_parts,
+        )
+        part = container = None
+        size = 0
+        for chunk in _with_end(self):
+            decoder.receive_data(chunk)
+            event = _next_event(decoder)
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, Field):
+                    part, container, size = event, [], 0
+                elif isinstance(event, File):
+                    part, container = event, tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+                elif isinstance(event, Data):
+                    if isinstance(part, Field):
+                        size += len(event.data)
+                        if request.max_form_memory_size is not None and size > request.max_form_memory_size:
+                            raise RequestEntityTooLarge()
+                        container.append(event.data)
+                    else:
+                        container.write(event.data)
+                    if not event.more_data:
+                        if isinstance(part, Field):
+                            yield part.name, b"".join(container).decode("utf-8", "replace")
+                        else:
+                            container.seek(0)
+                            yield part.name, FileStorage(container, part.filename, part.name, headers=part.headers)
+                event = _next_event(decoder)
+
+
+def _next_event(decoder):
+    try:
+        return decoder.next_event()
+    except ValueError:
+        raise BadRequest("Invalid multipart body") from None
+
+
+def _with_end(chunks):
+    # The decoder is told the body has ended by receiving None
+    yield from chunks
+    yield None
+
+
+def body_limit_view(view, max_body_size):
+    """Reject requests whose body is over max_body_size bytes before reading it.
+
+    A declared Content-Length over the limit is answered with 413 straight
+    away; a chunked body raises the same error once it goes past the limit.
+    """
+    def check():
+        request.max_content_length = max_body_size
+        if request.content_length is not None and request.content_length > max_body_size:
+            raise RequestEntityTooLarge()
+
+    if inspect.iscoroutinefunction(view):
+        async def limited(*args, **kwargs):
+            check()
+            return await view(*args, **kwargs)
+        return limited
+
+    def limited(*args, **kwargs):
+        check()
+        return view(*args, **kwargs)
+    return limited
+
+
+def body_handler(handler, options):
+    """Pass a route module's handler its unread request body as ``body``."""
+    options = options if isinstance(options, dict) else {}
+
+    if inspect.iscoroutinefunction(handler):
+        async def streaming_body_handler(*args, **kwargs):
+            return await handler(*args, body=RequestBody(**options), **kwargs)
+        return streaming_body_handler
+
+    def streaming_body_handler(*args, **kwargs):
+        return handler(*args, body=RequestBody(**options), **kwargs)
+    return streaming_body_handler
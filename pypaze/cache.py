@@ -0,0 +1,270 @@
+import asyncio
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from flask import copy_current_request_context, current_app, request
+
+CACHEABLE_METHODS = ("GET", "HEAD")
+
+
+class CacheEntry:
+    __slots__ = ("status", "headers", "body", "created", "ttl", "stale", "endpoint", "path")
+
+    def __init__(self, status, headers, body, ttl, stale, endpoint, path):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.created = time.monotonic()
+        self.ttl = ttl
+        self.stale = stale
+        self.endpoint = endpoint
+        self.path = path
+
+    def age(self):
+        return time.monotonic() - self.created
+
+
+class CacheBackend:
+    """Storage for cached responses.
+
+    Subclass this to keep responses somewhere shared between processes;
+    expiry and revalidation are handled by ResponseCache, so a backend only
+    stores and evicts entries.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, entry):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def purge(self, predicate):
+        """Remove every entry for which predicate(entry) is true; return the count."""
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU bounded by entry count and total body size."""
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old.body)
+            self._entries[key] = entry
+            self.size += len(entry.body)
+            while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry.body)
+
+    def purge(self, predicate):
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if predicate(entry)]
+            for key in keys:
+                self.size -= len(self._entries.pop(key).body)
+            return len(keys)
+
+
+class ResponseCache:
+    """Response cache shared by every route that declares ``cache``.
+
+    Fresh entries are served directly. Entries past their ttl but within
+    their ``stale_while_revalidate`` window are served while one background
+    refresh runs. Concurrent misses for the same key wait for a single
+    handler call instead of each running the handler.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryCache()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "refreshes": 0, "errors": 0}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _claim(self, key):
+        """Return (future, True) for the caller that should compute key, else (future, False)."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _release(self, key, future, entry=None, error=None):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(entry)
+
+    def _store(self, key, rv, options):
+        """Turn a handler result into a response, caching it if it's cacheable."""
+        response = current_app.make_response(rv)
+        if response.status_code not in options.get("statuses", (200,)) or response.is_streamed \
+                or "Set-Cookie" in response.headers:
+            return response, None
+        entry = CacheEntry(
+            response.status_code,
+            [(k, v) for k, v in response.headers.items() if k.lower() != "content-length"],
+            response.get_data(),
+            options.get("ttl", 60),
+            options.get("stale_while_revalidate", 0),
+            request.endpoint,
+            request.path,
+        )
+        self.backend.set(key, entry)
+        return response, entry
+
+    def respond(self, entry, state):
+        response = current_app.response_class(entry.body, status=entry.status, headers=entry.headers)
+        response.headers["X-Cache"] = state
+        return response
+
+    def lookup(self, key):
+        """Return (entry, state) where state is "HIT", "STALE" or None for a miss."""
+        entry = self.backend.get(key)
+        if entry is None:
+            return None, None
+        age = entry.age()
+        if age < entry.ttl:
+            self._count("hits")
+            return entry, "HIT"
+        if age < entry.ttl + entry.stale:
+            self._count("stale")
+            return entry, "STALE"
+        return None, None
+
+    def purge(self, endpoint=None, path=None):
+        def matches(entry):
+            return (endpoint is None or entry.endpoint == endpoint) and (path is None or entry.path == path)
+        return self.backend.purge(matches)
+
+
+def cache_key(options):
+    key = options.get("key")
+    base = key(request) if key else request.full_path
+    vary = "|".join(f"{h}={request.headers.get(h, '')}" for h in options.get("vary", ()))
+    return f"{request.endpoint}|{request.method}|{base}|{vary}"
+
+
+def cache_handler(handler, options):
+    """Wrap a route handler in the app's response cache."""
+    if inspect.iscoroutinefunction(handler):
+        async def cached_handler(*args, **kwargs):
+            if request.method not in CACHEABLE_METHODS:
+                return await handler(*args, **kwargs)
+            cache = current_app.extensions["pypaze.cache"]
+            key = cache_key(options)
+            entry, state = cache.lookup(key)
+            if state == "STALE":
+                _refresh(cache, key, lambda: asyncio.run(handler(*args, **kwargs)), options)
+            if entry is not None:
+                return cache.respond(entry, state)
+            future, leader = cache._claim(key)
+            if not leader:
+                try:
+                    entry = await asyncio.wrap_future(future)
+                except Exception:
+                    entry = None
+                return cache.respond(entry, "HIT") if entry is not None else await handler(*args, **kwargs)
+            cache._count("misses")
+            try:
+                response, entry = cache._store(key, await handler(*args, **kwargs), options)
+            except Exception as e:
+                cache._release(key, future, error=e)
+                raise
+            cache._release(key, future, entry)
+            response.headers["X-Cache"] = "MISS"
+            return response
+        return cached_handler
+
+    def cached_handler(*args, **kwargs):
+        if request.method not in CACHEABLE_METHODS:
+            return handler(*args, **kwargs)
+        cache = current_app.extensions["pypaze.cache"]
+        key = cache_key(options)
+        entry, state = cache.lookup(key)
+        if state == "STALE":
+            _refresh(cache, key, lambda: handler(*args, **kwargs), options)
+        if entry is not None:
+            return cache.respond(entry, state)
+        future, leader = cache._claim(key)
+        if not leader:
+            try:
+                entry = future.result()
+            except Exception:
+                entry = None
+            return cache.respond(entry, "HIT") if entry is not None else handler(*args, **kwargs)
+        cache._count("misses")
+        try:
+            response, entry = cache._store(key, handler(*args, **kwargs), options)
+        except Exception as e:
+            cache._release(key, future, error=e)
+            raise
+        cache._release(key, future, entry)
+        response.headers["X-Cache"] = "MISS"
+        return response
+    return cached_handler
+
+
+def _refresh(cache, key, call, options):
+    """Re-run the handler for a stale entry in the background, once per key."""
+    future, leader = cache._claim(key)
+    if not leader:
+        return
+
+    @copy_current_request_context
+    def refresh():
+        cache._count("refreshes")
+        try:
+            _, entry = cache._store(key, call(), options)
+        except Exception as e:
+            cache._count("errors")
+            current_app.logger.exception("Background cache refresh failed for %s", key)
+            cache._release(key, future, error=e)
+            return
+        cache._release(key, future, entry)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def purge_cache(app=None, route=None, path=None):
+    """Remove cached responses for a route (URL rule or endpoint) and/or a path.
+
+    With neither given, the whole cache is cleared. Returns the number of
+    entries removed.
+    """
+    app = app or current_app
+    endpoint = route
+    if route is not None and route.startswith("/"):
+        endpoint = next((r.endpoint for r in app.url_map.iter_rules() if r.rule == route), route)
+    return app.extensions["pypaze.cache"].purge(endpoint=endpoint, path=path)
@@ -1,8 +1,19 @@
 import click
+import json
 import os
 import shutil
+from functools import partial
 from pathlib import Path
 from .app import create_app
+from .asgi import create_asgi_app
+from .manifest import default_manifest_path, save_manifest
+from .routing import build_manifest, describe_routes
+from .routetree import RouteConflictError, RouteTree
+from .server import Arbiter, import_app
+from .export import export_site
+from .assets import build_assets
+from .templates import compile_templates
+from .bench import compare, measure_imports, run_bench
 
 @click.group()
 def cli():
@@ -451,13 +462,192 @@ def handler():
 @click.option('--host', default='127.0.0.1', help='Host address.')
 @click.option('--port', default=5000, help='Port number.')
 @click.option('--debug', is_flag=True, default=True, help='Enable debug mode.')
-def run(host, port, debug):
+@click.option('--lazy', is_flag=True, help='Import route modules on their first request.')
+@click.option('--asgi', is_flag=True, help='Serve on an event loop through uvicorn.')
+@click.option('--threads', default=None, type=int, help='Thread pool size for sync handlers under --asgi.')
+def run(host, port, debug, lazy, asgi, threads):
     """Run the app."""
-    app = create_app()
+    if asgi:
+        try:
+            import uvicorn
+        except ImportError:
+            raise click.ClickException("--asgi needs uvicorn: pip install 'pypaze[asgi]'")
+        uvicorn.run(create_asgi_app(max_threads=threads, lazy=lazy), host=host, port=port)
+        return
+    app = create_app(lazy=lazy)
     app.run(host=host, port=port, debug=debug)
 
 @cli.command()
-def routes():
-    """Display all available routes."""
-    app = create_app()
-    print(f"Registered routes: {', '.join(str(rule) for rule in app.url_map.iter_rules())}")
+@click.option('--base-path', default='routes', help='Directory containing route files.')
+@click.option('--static-folder', default='static', help='Directory containing static files.')
+@click.option('--template-folder', default='templates', help='Directory containing templates.')
+@click.option('--export', 'export_dir', default=None, help='Also render every page as static files into this directory.')
+@click.option('--workers', default=None, type=int, help='Processes used to render pages. Defaults to the CPU count.')
+def build(base_path, static_folder, template_folder, export_dir, workers):
+    """Build the route manifest, static assets and template bytecode."""
+    manifest = build_manifest(base_path)
+    manifest_path = default_manifest_path(base_path)
+    save_manifest(manifest_path, manifest)
+    print(f"Wrote {len(manifest['routes'])} routes to {manifest_path}")
+
+    if os.path.isdir(static_folder):
+        stats = build_assets(static_folder)
+        print(f"Built {stats['files']} static assets: {stats['written']} written "
+              f"({stats['compressed']} gzipped), {stats['unchanged']} unchanged")
+
+    if os.path.isdir(template_folder):
+        app = create_app(
+            base_path=base_path, static_folder=static_folder,
+            template_folder=template_folder, access_log=False,
+        )
+        compiled, errors = compile_templates(app)
+        print(f"Compiled {compiled} templates to {app.jinja_env.bytecode_cache.directory}")
+        for name, lineno, message in errors:
+            print(f"Template error in {name}, line {lineno}: {message}")
+        if errors:
+            raise SystemExit(1)
+
+    if export_dir:
+        stats = export_site(
+            export_dir, workers=workers, base_path=base_path,
+            static_folder=static_folder, template_folder=template_folder,
+        )
+        print(f"Exported to {export_dir}: {stats['written']} pages written, "
+              f"{stats['unchanged']} unchanged, {stats['static']} static files copied")
+        for rule in stats["skipped"]:
+            print(f"Skipped {rule}: no static_params() in its route module")
+        for path, status in stats["failed"]:
+            print(f"Failed {path}: HTTP {status}")
+        if stats["failed"]:
+            raise SystemExit(1)
+
+@cli.command()
+@click.option('--host', default='127.0.0.1', help='Host address.')
+@click.option('--port', default=8000, help='Port number.')
+@click.option('--workers', default=None, type=int, help='Number of worker processes. Defaults to the CPU count.')
+@click.option('--threads', default=4, help='Request threads per worker.')
+@click.option('--max-requests', default=0, help='Restart a worker after this many requests (0 disables).')
+@click.option('--max-memory', default=0, help='Restart a worker once its RSS exceeds this many MB (0 disables).')
+@click.option('--graceful-timeout', default=30, help='Seconds a stopping worker gets to finish in-flight requests.')
+@click.option('--app', 'app_path', default=None, help='Import path of the app, e.g. app:app. Defaults to create_app().')
+def serve(host, port, workers, threads, max_requests, max_memory, graceful_timeout, app_path):
+    """Serve the app with a pre-fork multi-worker server.
+
+    Send SIGHUP to reload the app and roll the workers over without dropping connections.
+    """
+    # Templates are compiled once in the arbiter and shared by the forked workers
+    load_app = import_app(app_path) if app_path else partial(create_app, warm_templates=True)
+    Arbiter(
+        load_app, host=host, port=port, workers=workers, threads=threads,
+        max_requests=max_requests, max_memory=max_memory * 1024 * 1024,
+        graceful_timeout=graceful_timeout,
+    ).run()
+
+@cli.command()
+@click.option('--routes', 'num_routes', default=100, help='Static and [param] routes to generate (plus 10% catch-alls).')
+@click.option('--requests', 'num_requests', default=2000, help='Requests per handler type for the throughput test.')
+@click.option('--runs', default=3, help='Cold starts to take the median of.')
+@click.option('--app-dir', default=None, help='Benchmark an existing project instead of a generated one.')
+@click.option('--output', default=None, help='Write the JSON results to this file.')
+@click.option('--baseline', default=None, help='Compare against results saved by a previous run.')
+@click.option('--threshold', default=0.1, help='Relative change that counts as a regression.')
+@click.option('--scaling', default='100,1000,10000', help='Route counts to measure match latency at ("" to skip).')
+def bench(num_routes, num_requests, runs, app_dir, output, baseline, threshold, scaling):
+    """Benchmark startup, route matching and request throughput."""
+    sizes = [int(size) for size in scaling.split(',') if size.strip()]
+    report = run_bench(routes=num_routes, requests=num_requests, runs=runs, app_dir=app_dir, scaling=sizes)
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(report, json.load(f), threshold=threshold)
+        for key, old, new, change in regressions:
+            print(f"REGRESSION {key}: {old:.4g} -> {new:.4g} ({change:+.1%})")
+        if regressions:
+            raise SystemExit(1)
+        print(f"No regressions beyond {threshold:.0%} against {baseline}")
+
+@cli.command()
+@click.argument('path')
+@click.option('--requests', 'num_requests', default=20, help='Number of requests to profile.')
+@click.option('--method', default='GET', help='HTTP method to use.')
+@click.option('--pstats', 'use_pstats', is_flag=True, help='Also write cProfile stats.')
+@click.option('--output', default=None, help='Directory for the profile files. Defaults to .pypaze/profiles.')
+def profile(path, num_requests, method, use_pstats, output):
+    """Profile requests to PATH and write flame graph input per route."""
+    app = create_app(access_log=False, profile={"sample_rate": 1.0, "pstats": use_pstats, "output_dir": output})
+    profiler = app.extensions["pypaze.profiler"]
+    client = app.test_client()
+    statuses = {}
+    for _ in range(num_requests):
+        response = client.open(path, method=method)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        response.close()
+    print(f"{num_requests} requests to {path}: " + ", ".join(f"{n} x {s}" for s, n in sorted(statuses.items())))
+    for rule, route in profiler.routes.items():
+        per_request = {phase: seconds * 1000 / route.requests for phase, seconds in route.phases.items()}
+        print(f"{rule}: " + ", ".join(f"{phase} {ms:.2f}ms" for phase, ms in sorted(per_request.items(), key=lambda i: -i[1])))
+        for stack, count in route.stacks.most_common(5):
+            frames = stack.split(";")
+            print(f"  {count:6d}  {frames[0]}: {frames[-1]}")
+    profiler.flush()
+    print(f"Wrote collapsed stacks{' and pstats' if use_pstats else ''} to {profiler.output_dir}")
+
+@cli.command()
+@click.option('--base-path', default='routes', help='Directory containing route files.')
+@click.option('--json', 'as_json', is_flag=True, help='Print the routes as JSON.')
+@click.option('--import-profile', is_flag=True, help='Also import each route file in a fresh interpreter and report its cost.')
+@click.option('--workers', default=None, type=int, help='Processes used to parse or import route files. Defaults to the CPU count.')
+def routes(base_path, as_json, import_profile, workers):
+    """List routes by parsing route files, without importing them."""
+    if not os.path.isdir(base_path):
+        raise click.ClickException(f"No route directory at {base_path}")
+    described = describe_routes(base_path, workers=workers)
+    if import_profile:
+        costs = measure_imports(base_path, [route["file"] for route in described], workers=workers)
+        for route, cost in zip(described, costs):
+            route["import"] = cost
+        # Most expensive first, so the modules that slow startup down are on top
+        described.sort(key=lambda route: -route["import"].get("seconds", float("inf")))
+
+    conflict = None
+    try:
+        RouteTree(route for route in described if route["methods"] and "error" not in route)
+    except RouteConflictError as e:
+        conflict = str(e)
+
+    if as_json:
+        print(json.dumps(described, indent=2))
+    else:
+        print(format_routes(described))
+    for route in described:
+        error = route.get("error") or route.get("import", {}).get("error")
+        if error:
+            print(f"{route['file']}: {error}")
+    if conflict:
+        raise click.ClickException(conflict)
+    if any("error" in route for route in described):
+        raise click.ClickException("Some route files could not be parsed")
+
+
+def format_routes(described):
+    """Render route descriptions as a plain-text table."""
+    def listed(values):
+        return "?" if values is None else ", ".join(values) or "-"
+
+    header = ["Rule", "Methods", "Handler", "Middleware", "File"]
+    rows = [[route["rule"], listed(route["methods"]), route["handler"] or "-",
+             listed(route["middleware"]), route["file"]] for route in described]
+    if any("import" in route for route in described):
+        header += ["Import ms", "Memory KiB"]
+        for row, route in zip(rows, described):
+            cost = route["import"]
+            row += ["error", "-"] if "error" in cost else [f"{cost['seconds'] * 1000:.1f}", f"{cost['rss_kb']:.0f}"]
+    widths = [max(len(str(cell)) for cell in column) for column in zip(header, *rows)]
+    return "\n".join("  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)).rstrip()
+                     for row in [header] + rows)
@@ -0,0 +1,105 @@
+import zlib
+from flask import current_app, request
+from werkzeug.wsgi import ClosingIterator
+
+COMPRESSIBLE_TYPES = (
+    "application/json", "application/javascript", "application/xml", "application/x-ndjson",
+    "image/svg+xml",
+)
+# zlib window bits for each content coding: gzip framing, or the zlib stream HTTP calls deflate
+ENCODINGS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+class Compressor:
+    """Response compression negotiated from Accept-Encoding.
+
+    Buffered bodies smaller than ``min_size`` are sent as is. Streamed
+    bodies are compressed chunk by chunk, each chunk flushed as soon as it
+    is produced, so clients still see data as it is generated.
+    """
+
+    def __init__(self, min_size=500, level=6, types=COMPRESSIBLE_TYPES, encodings=("gzip", "deflate")):
+        self.min_size = min_size
+        self.level = level
+        self.types = tuple(types)
+        self.encodings = encodings
+
+    def compressible(self, mimetype):
+        return bool(mimetype) and (mimetype.startswith("text/") or mimetype in self.types)
+
+    def negotiate(self):
+        best, best_quality = None, 0
+        for encoding in self.encodings:
+            quality = request.accept_encodings[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compress(self, response, min_size=None, level=None):
+        min_size = self.min_size if min_size is None else min_size
+        level = self.level if level is None else level
+        if (response.direct_passthrough or "Content-Encoding" in response.headers
+                or not self.compressible(response.mimetype)
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or "no-transform" in response.headers.get("Cache-Control", "")):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = self.negotiate()
+        if encoding is None or request.method == "HEAD":
+            return response
+
+        if response.is_streamed:
+            chunks = response.response
+            response.response = ClosingIterator(
+                _compress_chunks(chunks, encoding, level),
+                [chunks.close] if hasattr(chunks, "close") else [],
+            )
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < min_size:
+                return response
+            compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+            response.set_data(compressor.compress(data) + compressor.flush())
+
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            # The compressed body is a different representation, so it needs its own tag
+            response.set_etag(f"{etag}-{encoding}", weak)
+        return response
+
+
+def _compress_chunks(chunks, encoding, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        if not chunk:
+            continue
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def route_options(endpoint):
+    """The ``compress`` attribute of the route module behind endpoint, if any."""
+    view = current_app.extensions.get("pypaze.routes", {}).get(endpoint)
+    if view is None or view.module is None:
+        return None
+    return getattr(view.module, "compress", None)
+
+
+def install_compression(app, compressor):
+    """Compress responses through compressor.
+
+    A route module can set ``compress = False`` to opt out, or a dict with
+    ``min_size`` and/or ``level`` to override the defaults for that route.
+    """
+    app.extensions["pypaze.compression"] = compressor
+
+    @app.after_request
+    def compress_response(response):
+        options = route_options(request.endpoint)
+        if options is False:
+            return response
+        return compressor.compress(response, **(options if isinstance(options, dict) else {}))
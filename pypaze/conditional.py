@@ -0,0 +1,95 @@
+import inspect
+from datetime import datetime, timezone
+from flask import current_app, request
+from .compression import ENCODINGS
+
+CONDITIONAL_METHODS = ("GET", "HEAD")
+
+
+def _timestamp(value):
+    if value is None:
+        return None
+    if not isinstance(value, datetime):
+        value = datetime.fromtimestamp(value, timezone.utc)
+    elif value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.replace(microsecond=0)
+
+
+def _matching_tag(tag):
+    """The tag from If-None-Match that matches tag, counting compressed variants."""
+    if_none_match = request.if_none_match
+    if if_none_match.star_tag:
+        return tag
+    for candidate in [tag] + [f"{tag}-{encoding}" for encoding in ENCODINGS]:
+        if if_none_match.contains_weak(candidate):
+            return candidate
+    return None
+
+
+def not_modified(tag=None, last_modified=None):
+    """Return a 304 response if the request's validators match, else None."""
+    if tag is not None and request.if_none_match:
+        matched = _matching_tag(tag)
+        if matched is None:
+            return None
+        response = current_app.response_class(status=304)
+        response.set_etag(matched)
+    elif last_modified is not None and request.if_modified_since and not request.if_none_match:
+        if last_modified > request.if_modified_since:
+            return None
+        response = current_app.response_class(status=304)
+        if tag is not None:
+            response.set_etag(tag)
+    else:
+        return None
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+
+def _finish(rv, tag, last_modified, auto):
+    response = current_app.make_response(rv)
+    if response.status_code != 200:
+        return response
+    if tag is not None:
+        response.set_etag(tag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    if auto and tag is None and not response.is_streamed and "ETag" not in response.headers:
+        response.add_etag()
+        tag = response.get_etag()[0]
+        # The handler has run, but a match still saves sending the body
+        return not_modified(tag, last_modified) or response
+    return response
+
+
+def conditional_handler(handler, etag=None, last_modified=None, auto=False):
+    """Answer conditional GETs for a route handler.
+
+    ``etag`` and ``last_modified`` are the route module's validator
+    functions; they take the same URL values as the handler, and when the
+    request's If-None-Match / If-Modified-Since still match, a 304 is sent
+    without calling the handler. With ``auto``, responses that have no
+    validator get a strong ETag computed from their body.
+    """
+    def validators(kwargs):
+        return (
+            str(etag(**kwargs)) if etag is not None else None,
+            _timestamp(last_modified(**kwargs)) if last_modified is not None else None,
+        )
+
+    if inspect.iscoroutinefunction(handler):
+        async def conditional(*args, **kwargs):
+            if request.method not in CONDITIONAL_METHODS:
+                return await handler(*args, **kwargs)
+            tag, modified = validators(kwargs)
+            return not_modified(tag, modified) or _finish(await handler(*args, **kwargs), tag, modified, auto)
+        return conditional
+
+    def conditional(*args, **kwargs):
+        if request.method not in CONDITIONAL_METHODS:
+            return handler(*args, **kwargs)
+        tag, modified = validators(kwargs)
+        return not_modified(tag, modified) or _finish(handler(*args, **kwargs), tag, modified, auto)
+    return conditional
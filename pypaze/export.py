@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from .app import create_app
+
+STATE_FILE = ".pypaze-export.json"
+
+# Per-process state for pool workers, set up by _init_worker
+_worker = {}
+
+
+def export_paths(app):
+    """List the URL paths to export.
+
+    Every GET route without parameters is exported as is. Routes with
+    ``[param]`` segments are expanded through a ``static_params()`` function
+    in the route module, returning one dict of URL values per page.
+    """
+    adapter = app.url_map.bind("localhost")
+    paths, skipped = [], []
+    for endpoint, view in app.extensions.get("pypaze.routes", {}).items():
+        for rule in app.url_map.iter_rules(endpoint):
+            if "GET" not in rule.methods:
+                continue
+            if not rule.arguments:
+                paths.append(rule.rule)
+                continue
+            view.load()
+            static_params = getattr(view.module, "static_params", None)
+            if static_params is None:
+                skipped.append(rule.rule)
+                continue
+            for params in static_params():
+                paths.append(adapter.build(endpoint, params))
+    return paths, skipped
+
+
+def output_file(path, mimetype):
+    """Map a URL path to the file nginx would serve it from."""
+    name = path.strip("/")
+    if mimetype == "text/html":
+        return os.path.join(name, "index.html") if name else "index.html"
+    if os.path.splitext(name)[1]:
+        return name
+    extension = {"application/json": ".json", "text/plain": ".txt", "application/xml": ".xml"}
+    return (name or "index") + extension.get(mimetype, "")
+
+
+def _init_worker(options, out_dir, previous):
+    _worker.update(client=create_app(**options).test_client(), out_dir=out_dir, previous=previous)
+
+
+def _render(path):
+    """Render one page in a pool worker and write it if its content changed."""
+    out_dir, previous = _worker["out_dir"], _worker["previous"]
+    response = _worker["client"].get(path)
+    if response.status_code != 200:
+        return path, None, None, response.status_code
+    body = response.get_data()
+    digest = hashlib.sha256(body).hexdigest()
+    rel = output_file(path, response.mimetype)
+    target = os.path.join(out_dir, rel)
+    if previous.get(rel) != digest or not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(body)
+        return path, rel, digest, "written"
+    return path, rel, digest, "unchanged"
+
+
+def copy_static(app, out_dir):
+    """Mirror the static folder into out_dir, copying only changed files.
+
+    Built assets are copied too, since exported pages link to their
+    fingerprinted names.
+    """
+    target_root = os.path.join(out_dir, app.static_url_path.strip("/"))
+    copied = 0
+    if app.static_folder and os.path.isdir(app.static_folder):
+        copied += _copy_tree(app.static_folder, target_root)
+    if "pypaze.assets" in app.extensions:
+        copied += _copy_tree(app.extensions["pypaze.assets"]["dir"], target_root, skip=("assets.json",))
+    return copied
+
+
+def _copy_tree(source_root, target_root, skip=()):
+    copied = 0
+    for root, _, files in os.walk(source_root):
+        for file in files:
+            if root == source_root and file in skip:
+                continue
+            source = os.path.join(root, file)
+            target = os.path.join(target_root, os.path.relpath(source, source_root))
+            st = os.stat(source)
+            try:
+                tst = os.stat(target)
+                if tst.st_size == st.st_size and tst.st_mtime_ns == st.st_mtime_ns:
+                    continue
+            except OSError:
+                pass
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+            copied += 1
+    return copied
+
+
+def export_site(out_dir, workers=None, **options):
+    """Render every exportable page of the app into out_dir.
+
+    Pages are rendered through the test client on a pool of processes, each
+    with its own app built from ``options``. Files whose content hash is
+    unchanged since the last export are left untouched, and files from
+    pages that no longer exist are removed.
+    """
+    out_dir = os.path.abspath(out_dir)
+    app = create_app(**options)
+    paths, skipped = export_paths(app)
+
+    state_path = os.path.join(out_dir, STATE_FILE)
+    try:
+        with open(state_path) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = {}
+
+    state, stats, failed = {}, {"written": 0, "unchanged": 0}, []
+    initargs = (options, out_dir, previous)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        chunksize = max(1, len(paths) // ((workers or os.cpu_count() or 1) * 4))
+        for path, rel, digest, result in pool.map(_render, paths, chunksize=chunksize):
+            if rel is None:
+                failed.append((path, result))
+                continue
+            state[rel] = digest
+            stats[result] += 1
+
+    for rel in set(previous) - set(state):
+        try:
+            os.remove(os.path.join(out_dir, rel))
+        except OSError:
+            pass
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(state_path, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    stats.update(static=copy_static(app, out_dir), failed=failed, skipped=skipped)
+    return stats
@@ -1,5 +1,162 @@
+import atexit
+import importlib.util
+import os
+import sys
+import threading
+from flask import current_app
+
+EVENTS = ("startup", "post_fork", "teardown", "shutdown")
+# Route-directory module that declares hooks and resources instead of a route
+LIFECYCLE_FILE = "_lifecycle.py"
+
+
+class Resources:
+    """App-scoped resources such as connection pools, created once per process.
+
+    Each resource is registered with a factory and created on first use.
+    A key may be a type, in which case the factory must return an instance
+    of it. A process that was forked after a resource was created builds
+    its own rather than sharing the parent's sockets. Resources are closed
+    in reverse creation order on shutdown.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.factories = {}
+        self._instances = {}
+        self._pid = os.getpid()
+        self._lock = threading.RLock()
+
+    def register(self, key, factory, close=None):
+        """Register factory(app) to build key; close(resource) defaults to resource.close()."""
+        self.factories[key] = (factory, close)
+
+    def get(self, key):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Inherited across fork: the parent still owns these
+                self._instances, self._pid = {}, os.getpid()
+            if key in self._instances:
+                return self._instances[key]
+            if key not in self.factories:
+                raise KeyError(f"No resource registered for {key!r}")
+            resource = self.factories[key][0](self.app)
+            if isinstance(key, type) and not isinstance(resource, key):
+                raise TypeError(f"Resource factory for {key.__name__} returned {type(resource).__name__}")
+            self._instances[key] = resource
+            return resource
+
+    __getitem__ = get
+
+    def close(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._instances, self._pid = {}, os.getpid()
+            instances, self._instances = self._instances, {}
+        for key, resource in reversed(list(instances.items())):
+            close = self.factories[key][1]
+            try:
+                if close is not None:
+                    close(resource)
+                elif hasattr(resource, "close"):
+                    resource.close()
+            except Exception:
+                self.app.logger.exception("Closing resource %r failed", key)
+
+
+class Lifecycle:
+    """Hooks run at startup, after a worker forks, after each request and on shutdown.
+
+    startup and post_fork hooks get the app and stop startup if they
+    raise; teardown hooks get the request's exception (or None) and
+    shutdown hooks the app, and their errors are logged. Shutdown hooks run
+    in reverse order, then app resources are closed, at most once per
+    process.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.hooks = {event: [] for event in EVENTS}
+        self.resources = Resources(app)
+        self._shutdown_pid = None
+
+    def on(self, event, fn=None):
+        """Register fn for event; usable as a decorator."""
+        if event not in self.hooks:
+            raise ValueError(f"Unknown lifecycle event {event!r}, expected one of {', '.join(EVENTS)}")
+        if fn is None:
+            return lambda fn: self.on(event, fn)
+        self.hooks[event].append(fn)
+        return fn
+
+    def startup(self):
+        for hook in self.hooks["startup"]:
+            hook(self.app)
+
+    def post_fork(self):
+        # Hooks may still run in the new process, so it gets its own shutdown
+        self._shutdown_pid = None
+        for hook in self.hooks["post_fork"]:
+            hook(self.app)
+
+    def teardown(self, exc):
+        for hook in self.hooks["teardown"]:
+            try:
+                hook(exc)
+            except Exception:
+                self.app.logger.exception("Teardown hook %r failed", hook)
+
+    def shutdown(self):
+        if self._shutdown_pid == os.getpid():
+            return
+        self._shutdown_pid = os.getpid()
+        for hook in reversed(self.hooks["shutdown"]):
+            try:
+                hook(self.app)
+            except Exception:
+                self.app.logger.exception("Shutdown hook %r failed", hook)
+        self.resources.close()
+        # The atexit registration would otherwise keep a replaced app alive
+        atexit.unregister(self.shutdown)
+
+    def load(self, base_path):
+        """Register the hooks and resources declared in base_path's _lifecycle.py.
+
+        The module may define functions named after the events, and a
+        ``resources`` dict mapping keys to factories or (factory, close)
+        pairs.
+        """
+        path = os.path.join(base_path, LIFECYCLE_FILE)
+        if not os.path.exists(path):
+            return None
+        name = f"{os.path.basename(base_path)}._lifecycle"
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        # Lets route modules import the resource types declared here
+        sys.modules[name] = module
+        for event in EVENTS:
+            if callable(getattr(module, event, None)):
+                self.on(event, getattr(module, event))
+        for key, factory in getattr(module, "resources", {}).items():
+            self.resources.register(key, *(factory if isinstance(factory, tuple) else (factory,)))
+        return module
+
+
+def install_lifecycle(app):
+    lifecycle = app.extensions["pypaze.lifecycle"] = Lifecycle(app)
+    app.teardown_request(lifecycle.teardown)
+    return lifecycle
+
+
 def on_app_init(app):
-    """A hook for app initialization."""
-    print("App is initializing...")
+    """Run the app's startup hooks."""
+    lifecycle = app.extensions["pypaze.lifecycle"]
+    lifecycle.startup()
+    # Registered only once the app is built, so one that failed to build isn't kept alive
+    atexit.register(lifecycle.shutdown)
 
 
+def resource(key):
+    """The current app's resource for key, created in this process on first use."""
+    return current_app.extensions["pypaze.lifecycle"].resources.get(key)
@@ -0,0 +1,213 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import threading
+from concurrent.futures import FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
+from flask import current_app, g, has_app_context
+from .process import PerProcess
+
+
+class LoaderPool(PerProcess):
+    """Thread pool shared by every route's loaders, created in each process on first use."""
+
+    def __init__(self, max_workers=32):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+
+    def _start_process(self):
+        self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="pypaze-loader")
+
+    def submit(self, fn, *args):
+        self._ensure_started()
+        # Each task runs in a copy of the caller's context, so it sees the current request
+        return self._executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+class batch:
+    """Turn a bulk lookup into a per-request, DataLoader-style loader.
+
+    The decorated function takes a list of keys and returns a list of
+    values in the same order, or a dict keyed by key. ``load(key)`` calls
+    made by a request's loaders are collected and sent as one bulk call
+    once every running loader is waiting on a key (or after ``window``
+    seconds), and each key is looked up at most once per request.
+    """
+
+    def __init__(self, fn=None, window=0.005):
+        self.fn = fn
+        self.window = window
+        functools.update_wrapper(self, fn)
+
+    def __new__(cls, fn=None, window=0.005):
+        if fn is None:
+            return functools.partial(cls, window=window)
+        return super().__new__(cls)
+
+    def __call__(self, keys):
+        return self.fn(keys)
+
+    def load(self, key):
+        if not has_app_context():
+            return _values(self.fn([key]), [key])[0]
+        return _batches().load(self, key)
+
+    def load_many(self, keys):
+        if not has_app_context():
+            return _values(self.fn(list(keys)), list(keys))
+        return _batches().load_many(self, list(keys))
+
+
+def _values(result, keys):
+    if isinstance(result, dict):
+        return [result.get(key) for key in keys]
+    result = list(result)
+    if len(result) != len(keys):
+        raise ValueError(f"Batch loader returned {len(result)} values for {len(keys)} keys")
+    return result
+
+
+_state_lock = threading.Lock()
+
+
+def _batches():
+    state = g.get("_pypaze_batches")
+    if state is None:
+        with _state_lock:
+            state = g.get("_pypaze_batches")
+            if state is None:
+                state = g._pypaze_batches = _Batches()
+    return state
+
+
+class _Batches:
+    """Per-request queue of pending batch loads and their memoized results."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.pending = {}
+        self.memo = {}
+
+    def run(self, fn, kwargs):
+        """Run one loader, counting it as active for batch dispatch."""
+        try:
+            return fn(**kwargs)
+        finally:
+            with self.cond:
+                self.active -= 1
+                self.cond.notify_all()
+
+    def load(self, loader, key):
+        return self.load_many(loader, [key])[0]
+
+    def load_many(self, loader, keys):
+        with self.cond:
+            futures = []
+            for key in keys:
+                future = self.memo.get((loader, key))
+                if future is None:
+                    future = self.memo[(loader, key)] = Future()
+                    self.pending.setdefault(loader, {})[key] = future
+                futures.append(future)
+            self.waiting += 1
+        try:
+            for future in futures:
+                self._wait(loader, future)
+        finally:
+            with self.cond:
+                self.waiting -= 1
+        return [future.result() for future in futures]
+
+    def _wait(self, loader, future):
+        timed_out = False
+        while True:
+            with self.cond:
+                if future.done():
+                    return
+                if not self.pending or (self.waiting < self.active and not timed_out):
+                    timed_out = not self.cond.wait(loader.window)
+                    continue
+                batches, self.pending = self.pending, {}
+                timed_out = False
+            self._dispatch(batches)
+
+    def _dispatch(self, batches):
+        # Different loaders' bulk calls run side by side; the first one on this thread
+        items = list(batches.items())
+        threads = [
+            threading.Thread(target=contextvars.copy_context().run, args=(self._call, loader, futures), daemon=True)
+            for loader, futures in items[1:]
+        ]
+        for thread in threads:
+            thread.start()
+        self._call(*items[0])
+        for thread in threads:
+            thread.join()
+        with self.cond:
+            self.cond.notify_all()
+
+    def _call(self, loader, futures):
+        keys = list(futures)
+        try:
+            values = _values(loader.fn(keys), keys)
+        except Exception as e:
+            for future in futures.values():
+                future.set_exception(e)
+        else:
+            for future, value in zip(futures.values(), values):
+                future.set_result(value)
+
+
+def _arguments(fn):
+    """Names of the URL values fn accepts, or None if it takes **kwargs."""
+    params = inspect.signature(fn).parameters.values()
+    if any(p.kind is p.VAR_KEYWORD for p in params):
+        return None
+    return {p.name for p in params}
+
+
+def loader_handler(handler, loaders):
+    """Run a route module's ``loaders`` concurrently, then call the handler with their results.
+
+    ``loaders`` maps argument names to functions taking any of the route's
+    URL values. Sync loaders run on the app's LoaderPool; under an async
+    handler, async loaders are awaited on the event loop alongside them.
+    """
+    loaders = [(name, fn, _arguments(fn), inspect.iscoroutinefunction(fn)) for name, fn in loaders.items()]
+
+    def arguments(accepts, kwargs):
+        return kwargs if accepts is None else {k: v for k, v in kwargs.items() if k in accepts}
+
+    def submit(state, fn, accepts, kwargs):
+        fn = current_app.ensure_sync(fn)
+        return current_app.extensions["pypaze.loaders"].submit(state.run, fn, arguments(accepts, kwargs))
+
+    if inspect.iscoroutinefunction(handler):
+        async def loaded_handler(*args, **kwargs):
+            state = _batches()
+            with state.cond:
+                state.active += sum(not is_async for _, _, _, is_async in loaders)
+            calls = [
+                fn(**arguments(accepts, kwargs)) if is_async
+                else asyncio.wrap_future(submit(state, fn, accepts, kwargs))
+                for _, fn, accepts, is_async in loaders
+            ]
+            results = await asyncio.gather(*calls)
+            kwargs.update(zip((name for name, _, _, _ in loaders), results))
+            return await handler(*args, **kwargs)
+        return loaded_handler
+
+    def loaded_handler(*args, **kwargs):
+        state = _batches()
+        with state.cond:
+            state.active += len(loaders)
+        futures = [submit(state, fn, accepts, kwargs) for _, fn, accepts, _ in loaders]
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in futures:
+            if future in done and future.exception() is not None:
+                raise future.exception()
+        kwargs.update((name, future.result()) for (name, _, _, _), future in zip(loaders, futures))
+        return handler(*args, **kwargs)
+    return loaded_handler
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+
+# Bumped whenever the rule derived from a file name changes, so old manifests are rebuilt
+MANIFEST_VERSION = 2
+BUILD_DIR = ".pypaze"
+
+
+def default_manifest_path(base_path):
+    """Manifest location for a routes directory: <project>/.pypaze/routes.json."""
+    project = os.path.dirname(os.path.abspath(base_path))
+    return os.path.join(project, BUILD_DIR, "routes.json")
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def route_entry(path, **fields):
+    """Build a manifest entry for the file at path, stamping its hash and stat."""
+    st = os.stat(path)
+    fields.update(hash=file_hash(path), mtime=st.st_mtime_ns, size=st.st_size)
+    return fields
+
+
+def is_fresh(path, entry):
+    """Check whether path still matches its manifest entry.
+
+    The stat fields are compared first; the file is only hashed when they
+    differ, and a matching hash refreshes the recorded stat in place.
+    """
+    st = os.stat(path)
+    if st.st_mtime_ns == entry["mtime"] and st.st_size == entry["size"]:
+        return True
+    if file_hash(path) != entry["hash"]:
+        return False
+    entry["mtime"], entry["size"] = st.st_mtime_ns, st.st_size
+    return True
+
+
+def scan_dirs(base_path):
+    """Map every directory under base_path to its mtime.
+
+    Adding or removing a file changes its directory's mtime, so comparing
+    these tells whether the set of route files has changed without listing
+    every directory.
+    """
+    dirs = {}
+    for root, subdirs, _ in os.walk(base_path):
+        subdirs[:] = [d for d in subdirs if d != "__pycache__" and not d.startswith(".")]
+        rel = os.path.relpath(root, base_path)
+        dirs["" if rel == "." else rel] = os.stat(root).st_mtime_ns
+    return dirs
+
+
+def load_manifest(path):
+    """Load a manifest, returning None if it is missing, unreadable or outdated."""
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(path, manifest):
+    manifest = dict(manifest, version=MANIFEST_VERSION)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
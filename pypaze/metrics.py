@@ -0,0 +1,308 @@
+import bisect
+import inspect
+import json
+import os
+import threading
+import time
+from flask import current_app, request
+from werkzeug.exceptions import HTTPException
+from .process import PerProcess
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "pypaze_requests_total": ("counter", "Requests handled by file routes."),
+    "pypaze_request_duration_seconds": ("histogram", "Time spent in route middleware and handler."),
+    "pypaze_middleware_duration_seconds": ("histogram", "Time spent in a route's middleware chain."),
+    "pypaze_requests_in_flight": ("gauge", "Requests currently being handled."),
+    "pypaze_cache_events_total": ("counter", "Response cache lookups and refreshes by outcome."),
+    "pypaze_requests_rejected_total": ("counter", "Requests shed by admission control, by reason."),
+    "pypaze_tasks_total": ("counter", "Deferred task attempts by outcome."),
+    "pypaze_tasks_queued": ("gauge", "Deferred tasks waiting for a worker."),
+    "pypaze_task_duration_seconds": ("histogram", "Time spent running a deferred task."),
+    "pypaze_task_queue_seconds": ("histogram", "Time a deferred task waited in the queue."),
+}
+
+
+class Metrics(PerProcess):
+    """Counters, gauges and fixed-bucket histograms for file routes.
+
+    Values are kept per process. When ``multiprocess_dir`` is set, each
+    process also snapshots its values to ``<dir>/<pid>.json`` every
+    ``interval`` seconds, and the metrics endpoint sums the snapshots of
+    every worker, so a pre-forked server can be scraped through any worker.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, path="/__pypaze/metrics", multiprocess_dir=None, interval=5.0):
+        self.buckets = tuple(sorted(buckets))
+        self.path = path
+        self.multiprocess_dir = multiprocess_dir or os.environ.get("PYPAZE_METRICS_DIR")
+        self.interval = interval
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + value
+
+    def add(self, name, labels, value):
+        with self._lock:
+            series = self.gauges.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            counts = series.get(labels)
+            if counts is None:
+                # One slot per bucket, then +Inf, sum and count
+                counts = series[labels] = [0] * (len(self.buckets) + 3)
+            counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+        if self.multiprocess_dir:
+            self._ensure_started()
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {
+                "counters": {n: dict(s) for n, s in self.counters.items()},
+                "gauges": {n: dict(s) for n, s in self.gauges.items()},
+                "histograms": {n: {k: list(v) for k, v in s.items()} for n, s in self.histograms.items()},
+            }
+        for collect in self.collectors:
+            for kind, name, labels, value in collect():
+                snapshot[kind].setdefault(name, {})[labels] = value
+        return snapshot
+
+    # -- multi-process aggregation --
+
+    def _start_process(self):
+        os.makedirs(self.multiprocess_dir, exist_ok=True)
+        threading.Thread(target=self._write_loop, name="pypaze-metrics", daemon=True).start()
+
+    def _write_loop(self):
+        while True:
+            self.write_snapshot()
+            time.sleep(self.interval)
+
+    def write_snapshot(self):
+        path = os.path.join(self.multiprocess_dir, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(_encode(self.snapshot()), f)
+        os.replace(path + ".tmp", path)
+
+    def flush(self):
+        if self.multiprocess_dir and self._started():
+            self.write_snapshot()
+
+    def aggregate(self):
+        """Sum this process's live values with every other worker's snapshot.
+
+        Snapshots of workers that have exited are folded into an archive so
+        counters keep growing across restarts; their gauges are dropped.
+        """
+        if not self.multiprocess_dir or not os.path.isdir(self.multiprocess_dir):
+            return self.snapshot()
+        import fcntl
+        total = self.snapshot()
+        with open(os.path.join(self.multiprocess_dir, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive_path = os.path.join(self.multiprocess_dir, "archive.json")
+            archive = _load(archive_path) or {"counters": {}, "gauges": {}, "histograms": {}}
+            archived = False
+            for file in os.listdir(self.multiprocess_dir):
+                if not file.endswith(".json") or file == "archive.json":
+                    continue
+                pid = int(file[:-5])
+                if pid == os.getpid():
+                    continue
+                snapshot = _load(os.path.join(self.multiprocess_dir, file))
+                if snapshot is None:
+                    continue
+                if _alive(pid):
+                    _merge(total, snapshot, gauges=True)
+                else:
+                    _merge(archive, snapshot, gauges=False)
+                    os.remove(os.path.join(self.multiprocess_dir, file))
+                    archived = True
+            if archived:
+                with open(archive_path, "w") as f:
+                    json.dump(_encode(archive), f)
+            _merge(total, archive, gauges=False)
+        return total
+
+    def render(self):
+        """Render the aggregated metrics in the Prometheus text format."""
+        snapshot = self.aggregate()
+        lines = []
+        for kind in ("counters", "gauges", "histograms"):
+            for name, series in sorted(snapshot[kind].items()):
+                metric_type, help_text = HELP.get(name, (kind.rstrip("s"), name))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in sorted(series.items()):
+                    if kind != "histograms":
+                        lines.append(f"{name}{_labels(labels)} {value}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + ("+Inf",), value[:-2]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {value[-2]}")
+                    lines.append(f"{name}_count{_labels(labels)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+def _encode(snapshot):
+    return {kind: {n: [[list(map(list, k)), v] for k, v in s.items()] for n, s in series.items()}
+            for kind, series in snapshot.items()}
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return {kind: {n: {tuple(map(tuple, k)): v for k, v in s} for n, s in series.items()}
+            for kind, series in data.items()}
+
+
+def _merge(total, snapshot, gauges):
+    for kind in ("counters", "gauges", "histograms"):
+        if kind == "gauges" and not gauges:
+            continue
+        for name, series in snapshot.get(kind, {}).items():
+            target = total[kind].setdefault(name, {})
+            for labels, value in series.items():
+                if kind == "histograms":
+                    current = target.get(labels)
+                    target[labels] = value[:] if current is None else [a + b for a, b in zip(current, value)]
+                else:
+                    target[labels] = target.get(labels, 0) + value
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _status(rv):
+    if isinstance(rv, tuple) and len(rv) > 1 and isinstance(rv[1], int):
+        return rv[1]
+    return getattr(rv, "status_code", 200)
+
+
+def instrument_view(metrics, view, rule):
+    """Record count, latency and in-flight requests for one route's view."""
+    def record(start, status):
+        labels = (("rule", rule), ("method", request.method), ("status", str(status)))
+        metrics.observe("pypaze_request_duration_seconds", labels, time.perf_counter() - start)
+        metrics.inc("pypaze_requests_total", labels)
+
+    in_flight = (("rule", rule),)
+
+    if inspect.iscoroutinefunction(view):
+        async def instrumented(*args, **kwargs):
+            start = time.perf_counter()
+            metrics.add("pypaze_requests_in_flight", in_flight, 1)
+            status = 500
+            try:
+                rv = await view(*args, **kwargs)
+                status = _status(rv)
+                return rv
+            except HTTPException as e:
+                status = e.code
+                raise
+            finally:
+                metrics.add("pypaze_requests_in_flight", in_flight, -1)
+                record(start, status)
+        return instrumented
+
+    def instrumented(*args, **kwargs):
+        start = time.perf_counter()
+        metrics.add("pypaze_requests_in_flight", in_flight, 1)
+        status = 500
+        try:
+            rv = view(*args, **kwargs)
+            status = _status(rv)
+            return rv
+        except HTTPException as e:
+            status = e.code
+            raise
+        finally:
+            metrics.add("pypaze_requests_in_flight", in_flight, -1)
+            record(start, status)
+    return instrumented
+
+
+def timed_middleware(metrics, middleware, rule):
+    """Collapse a middleware list into one middleware that times the chain."""
+    def observe(start):
+        labels = (("rule", rule), ("method", request.method))
+        metrics.observe("pypaze_middleware_duration_seconds", labels, time.perf_counter() - start)
+
+    if any(inspect.iscoroutinefunction(mw) for mw in middleware):
+        async def chain(req):
+            start = time.perf_counter()
+            try:
+                for mw in middleware:
+                    mw_response = mw(req)
+                    if inspect.isawaitable(mw_response):
+                        mw_response = await mw_response
+                    if mw_response:
+                        return mw_response
+            finally:
+                observe(start)
+        return [chain]
+
+    def chain(req):
+        start = time.perf_counter()
+        try:
+            for mw in middleware:
+                mw_response = mw(req)
+                if mw_response:
+                    return mw_response
+        finally:
+            observe(start)
+    return [chain]
+
+
+def install_metrics(app, metrics):
+    app.extensions["pypaze.metrics"] = metrics
+
+    def metrics_endpoint():
+        return current_app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    cache = app.extensions.get("pypaze.cache")
+    if cache is not None:
+        metrics.collectors.append(lambda: [
+            ("counters", "pypaze_cache_events_total", (("event", event),), count)
+            for event, count in cache.stats.items()
+        ])
+
+    lifecycle = app.extensions.get("pypaze.lifecycle")
+    if lifecycle is not None:
+        # Save this process's final counts before it exits
+        lifecycle.on("shutdown", lambda app: metrics.flush())
+
+    if metrics.path:
+        app.add_url_rule(metrics.path, endpoint="pypaze_metrics", view_func=metrics_endpoint)
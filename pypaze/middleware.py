@@ -1,6 +1,21 @@
-from flask import request
+from .accesslog import AccessLog, install_access_log
+from .compression import Compressor, install_compression
 
-def apply_global_middleware(app):
-    @app.before_request
-    def log_request():
-        print(f"Request: {request.method} {request.path}")
+def apply_global_middleware(app, access_log=True, compress=False):
+    # access_log may be True, a dict of AccessLog options or an AccessLog;
+    # when falsy nothing is installed, so requests pay nothing for it
+    if access_log:
+        if isinstance(access_log, dict):
+            access_log = AccessLog(**access_log)
+        elif not isinstance(access_log, AccessLog):
+            access_log = AccessLog()
+        install_access_log(app, access_log)
+
+    # Same for compress; installed after the access log so the log records
+    # the compressed size
+    if compress:
+        if isinstance(compress, dict):
+            compress = Compressor(**compress)
+        elif not isinstance(compress, Compressor):
+            compress = Compressor()
+        install_compression(app, compress)
@@ -0,0 +1,69 @@
+import os
+from urllib.parse import quote
+from flask import g, has_request_context, request
+
+# Static files worth preloading, by extension, with their `as` destination
+PRELOAD_TYPES = {".css": "style", ".js": "script", ".mjs": "script", ".woff2": "font", ".woff": "font"}
+
+
+class Preloader:
+    """Preload hints for the static assets each route's pages use.
+
+    Every ``url_for('static', ...)`` made while handling a request is
+    recorded. HTML responses get a ``Link: rel=preload`` header for the
+    stylesheets, scripts and fonts among them (at most ``max_links``), and
+    the list is remembered per URL rule. Later requests for the rule are
+    sent those links in a 103 Early Hints response before the handler runs,
+    when the server supports it (``pypaze serve`` does) and ``early_hints``
+    is on.
+    """
+
+    def __init__(self, max_links=8, early_hints=True, types=None):
+        self.max_links = max_links
+        self.early_hints = early_hints
+        self.types = PRELOAD_TYPES if types is None else types
+        self.routes = {}
+
+    def links(self, paths):
+        links = []
+        for path in dict.fromkeys(paths):
+            destination = self.types.get(os.path.splitext(path)[1].lower())
+            if destination is None:
+                continue
+            link = f"<{path}>; rel=preload; as={destination}"
+            links.append(link + "; crossorigin" if destination == "font" else link)
+            if len(links) == self.max_links:
+                break
+        return links
+
+
+def install_preload(app, preloader):
+    app.extensions["pypaze.preload"] = preloader
+
+    @app.url_defaults
+    def record_static_url(endpoint, values):
+        # Registered after the asset fingerprinting hook, so this sees the final name
+        if endpoint == "static" and has_request_context() and "filename" in values:
+            path = f"{request.script_root}{app.static_url_path}/{quote(values['filename'])}"
+            g.setdefault("_pypaze_static", []).append(path)
+
+    @app.before_request
+    def send_early_hints():
+        send = request.environ.get("pypaze.early_hints")
+        if send is None or not preloader.early_hints or request.method != "GET" or request.url_rule is None:
+            return
+        links = preloader.routes.get(request.url_rule.rule)
+        if links:
+            send(links)
+
+    @app.after_request
+    def add_preload_links(response):
+        paths = g.pop("_pypaze_static", None)
+        if not paths or response.status_code != 200 or response.mimetype != "text/html":
+            return response
+        links = preloader.links(paths)
+        if links:
+            response.headers.add("Link", ", ".join(links))
+            if request.url_rule is not None:
+                preloader.routes[request.url_rule.rule] = links
+        return response
@@ -0,0 +1,26 @@
+import os
+
+
+class PerProcess:
+    """Starts an object's threads lazily, once in each process that uses it.
+
+    Threads don't survive fork, so anything built before ``pypaze serve``
+    forks its workers starts them on first use in each worker instead.
+    Subclasses set ``_lock`` and implement ``_start_process``.
+    """
+
+    _pid = None
+
+    def _started(self):
+        return self._pid == os.getpid()
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start_process()
+                    # Set last, so other threads only skip the lock once everything exists
+                    self._pid = os.getpid()
+
+    def _start_process(self):
+        raise NotImplementedError
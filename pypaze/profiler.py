@@ -0,0 +1,244 @@
+import cProfile
+import hmac
+import inspect
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from flask import current_app, request
+from .manifest import BUILD_DIR
+from .process import PerProcess
+
+PHASES = ("middleware", "loaders", "template", "serialization", "handler")
+_LOADERS_FILE = os.path.join("pypaze", "loaders.py")
+_TEMPLATE_FILES = (os.sep + "jinja2" + os.sep, os.path.join("flask", "templating.py"))
+
+
+def default_profile_dir(base_path):
+    project = os.path.dirname(os.path.abspath(base_path))
+    return os.path.join(project, BUILD_DIR, "profiles")
+
+
+def _serialize(rv):
+    # A function of its own so samples taken inside it count as serialization
+    return current_app.make_response(rv)
+
+
+class _Sampler(threading.Thread):
+    """Samples one thread's stack every ``interval`` seconds until stopped."""
+
+    def __init__(self, thread_id, stop_code, interval):
+        super().__init__(name="pypaze-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.stop_code = stop_code
+        self.interval = interval
+        self.samples = []
+        self._done = threading.Event()
+
+    def run(self):
+        last = time.perf_counter()
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            stack = []
+            while frame is not None and frame.f_code is not self.stop_code:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            if frame is not None:
+                self.samples.append((stack[::-1], now - last))
+            last = now
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.samples
+
+
+class RouteProfile:
+    """Aggregated samples for one URL rule."""
+
+    def __init__(self):
+        self.requests = 0
+        self.stacks = Counter()
+        self.phases = Counter()
+        self.stats = None
+
+
+class Profiler(PerProcess):
+    """Opt-in profiler for file routes.
+
+    A request is profiled when it carries ``header`` with the configured
+    ``secret``, or at random with probability ``sample_rate``. Its
+    middleware, loaders, handler and response serialization are sampled
+    every ``interval`` seconds; samples are aggregated per URL rule in
+    memory and written to ``output_dir`` every ``flush_interval`` seconds
+    and at shutdown, as collapsed stacks (for flamegraph.pl, speedscope and
+    similar) and, with ``pstats=True``, as cProfile stats. Profiled responses carry a Server-Timing header with the time spent in
+    each phase. Routes are only wrapped when a Profiler is installed.
+    """
+
+    def __init__(self, secret=None, sample_rate=0.0, output_dir=None, interval=0.001,
+                 header="X-Pypaze-Profile", pstats=False, flush_interval=10.0):
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.interval = interval
+        self.header = header
+        self.pstats = pstats
+        self.flush_interval = flush_interval
+        self.routes = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def _start_process(self):
+        self._stop = threading.Event()
+        self._writer = threading.Thread(target=self._run, name="pypaze-profile-writer", daemon=True)
+        self._writer.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def wanted(self):
+        if self.secret:
+            value = request.headers.get(self.header)
+            if value is not None and hmac.compare_digest(value, self.secret):
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def phase(self, stack, markers):
+        # The innermost frame that belongs to a phase decides it
+        for code in reversed(stack):
+            if code in markers:
+                return markers[code]
+            if code.co_filename.endswith(_LOADERS_FILE):
+                return "loaders"
+            if any(part in code.co_filename for part in _TEMPLATE_FILES):
+                return "template"
+            if code is _serialize.__code__:
+                return "serialization"
+        return "handler"
+
+    def record(self, rule, samples, markers, profile=None):
+        phases = Counter()
+        with self._lock:
+            route = self.routes.setdefault(rule, RouteProfile())
+            route.requests += 1
+            for stack, seconds in samples:
+                phase = self.phase(stack, markers)
+                phases[phase] += seconds
+                frames = ";".join(_label(code) for code in stack)
+                route.stacks[f"{phase};{frames}" if frames else phase] += 1
+            route.phases.update(phases)
+            if profile is not None:
+                if route.stats is None:
+                    route.stats = pstats.Stats(profile)
+                else:
+                    route.stats.add(profile)
+            self._dirty.add(rule)
+        if self.output_dir:
+            self._ensure_started()
+        return phases
+
+    def flush(self):
+        """Write the routes profiled since the last flush to output_dir."""
+        if not self.output_dir:
+            return
+        # Copied under the lock, written outside it so requests aren't held up
+        with self._lock:
+            dirty = [(rule, self.routes[rule]) for rule in self._dirty]
+            self._dirty.clear()
+            snapshots = [
+                (rule, route.stacks.most_common(), None if route.stats is None else marshal.dumps(route.stats.stats))
+                for rule, route in dirty
+            ]
+        if snapshots:
+            os.makedirs(self.output_dir, exist_ok=True)
+        for rule, stacks, stats in snapshots:
+            path = os.path.join(self.output_dir, _slug(rule))
+            _replace(path + ".collapsed", "".join(f"{stack} {count}\n" for stack, count in stacks).encode())
+            if stats is not None:
+                _replace(path + ".pstats", stats)
+
+    def close(self):
+        """Stop this process's writer and flush what it hasn't written yet."""
+        if self._started():
+            self._stop.set()
+            self._writer.join()
+            self._pid = None
+        self.flush()
+
+
+def install_profiler(app, profiler):
+    app.extensions["pypaze.profiler"] = profiler
+    app.extensions["pypaze.lifecycle"].on("shutdown", lambda app: profiler.close())
+
+
+def _replace(path, data):
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+def _label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _slug(rule):
+    slug = rule.strip("/").replace("/", "_").replace("<", "").replace(">", "").replace(":", "-")
+    return slug or "index"
+
+
+def _server_timing(response, phases):
+    # A request faster than one sampling interval has no phases to report
+    if not phases:
+        return
+    response.headers["Server-Timing"] = ", ".join(
+        f"{phase};dur={phases[phase] * 1000:.2f}" for phase in PHASES if phases.get(phase)
+    )
+
+
+def profiled_view(profiler, view, rule, module):
+    """Profile the requests to view that profiler picks."""
+    markers = {getattr(module.handler, "__code__", None): "handler"}
+    for mw in getattr(module, "middleware", []):
+        markers[getattr(mw, "__code__", None)] = "middleware"
+    for loader in getattr(module, "loaders", {}).values():
+        markers[getattr(loader, "__code__", None)] = "loaders"
+    markers.pop(None, None)
+
+    if inspect.iscoroutinefunction(view):
+        async def profiled(*args, **kwargs):
+            if not profiler.wanted():
+                return await view(*args, **kwargs)
+            sampler = _Sampler(threading.get_ident(), profiled.__code__, profiler.interval)
+            sampler.start()
+            try:
+                response = _serialize(await view(*args, **kwargs))
+            finally:
+                samples = sampler.stop()
+            _server_timing(response, profiler.record(rule, samples, markers))
+            return response
+        return profiled
+
+    def profiled(*args, **kwargs):
+        if not profiler.wanted():
+            return view(*args, **kwargs)
+        sampler = _Sampler(threading.get_ident(), profiled.__code__, profiler.interval)
+        profile = cProfile.Profile() if profiler.pstats else None
+        sampler.start()
+        if profile is not None:
+            profile.enable()
+        try:
+            response = _serialize(view(*args, **kwargs))
+        finally:
+            if profile is not None:
+                profile.disable()
+            samples = sampler.stop()
+        _server_timing(response, profiler.record(rule, samples, markers, profile))
+        return response
+    return profiled
@@ -0,0 +1,75 @@
+import re
+
+_PARAM = re.compile(r"<(?:([^:<>]+):)?([^<>]+)>")
+
+# Precedence of segment kinds when two routes could match the same path
+STATIC, DYNAMIC, CATCH_ALL = 0, 1, 2
+
+
+class RouteConflictError(Exception):
+    """Two route files resolve to the same or an indistinguishable URL rule."""
+
+
+def segment_key(segment):
+    """Classify one rule segment as (kind, key).
+
+    Parameter names are dropped from the key, so ``<id>`` and ``<slug>`` in
+    the same position are recognised as the same shape, while different
+    converters (``<int:id>`` and ``<slug>``) stay distinct.
+    """
+    params = _PARAM.findall(segment)
+    if not params:
+        return STATIC, segment
+    if any(converter == "path" for converter, _ in params):
+        return CATCH_ALL, _PARAM.sub(lambda m: "<path>", segment)
+    return DYNAMIC, _PARAM.sub(lambda m: f"<{m.group(1) or 'default'}>", segment)
+
+
+class _Node:
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children = {}
+        self.entries = []
+
+
+class RouteTree:
+    """Segment trie of route entries.
+
+    Used to reject duplicate and ambiguous routes before they are
+    registered, and to register routes in order of specificity (static
+    segments before dynamic ones before catch-alls). Matching itself is left
+    to Werkzeug, whose state machine matcher already walks segments.
+    """
+
+    def __init__(self, entries=()):
+        self.root = _Node()
+        for entry in entries:
+            self.insert(entry)
+
+    def insert(self, entry):
+        node = self.root
+        for segment in entry["rule"].strip("/").split("/"):
+            if segment:
+                node = node.children.setdefault(segment_key(segment), _Node())
+        if entry["rule"] != "/" and entry["rule"].endswith("/"):
+            # /blog/ (blog/index.py) and /blog (blog.py) are different rules
+            node = node.children.setdefault((STATIC, ""), _Node())
+        methods = {method.upper() for method in entry["methods"]}
+        for other in node.entries:
+            overlap = methods & {method.upper() for method in other["methods"]}
+            if overlap:
+                kind = "duplicates" if other["rule"] == entry["rule"] else "is ambiguous with"
+                raise RouteConflictError(
+                    f"{entry['rule']} ({entry['file']}) {kind} {other['rule']} ({other['file']}) "
+                    f"for {', '.join(sorted(overlap))}"
+                )
+        node.entries.append(entry)
+
+    def ordered(self):
+        """Yield entries most specific first, siblings sorted by segment."""
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            yield from node.entries
+            stack.extend(node.children[key] for key in sorted(node.children, reverse=True))
@@ -1,43 +1,457 @@
 import os
+import re
+import inspect
+import threading
 import importlib.util
-from flask import request
+import ast
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from flask import current_app, request
+from .analysis import literal, module_names, reference_names
+from .bodies import body_handler, body_limit_view
+from .cache import cache_handler
+from .admission import admission_view
+from .conditional import conditional_handler
+from .hooks import LIFECYCLE_FILE
+from .loaders import loader_handler
+from .profiler import profiled_view
+from .metrics import instrument_view, timed_middleware
+from .manifest import is_fresh, route_entry, save_manifest, scan_dirs
+from .routetree import RouteTree
+from .serialization import stream_handler
 
-def register_routes(app, base_path):
-    for root, _, files in os.walk(base_path):
+
+def iter_route_files(base_path):
+    """Yield route file paths relative to base_path."""
+    for root, dirs, files in os.walk(base_path):
+        dirs[:] = [d for d in dirs if d != "__pycache__" and not d.startswith(".")]
         for file in files:
+            if file == LIFECYCLE_FILE and root == base_path:
+                continue
             if file.endswith(".py") and file != "__init__.py":
-                relative_path = os.path.relpath(os.path.join(root, file), base_path)
-                module_path = os.path.join(root, file).replace("/", ".").replace("\\", ".").replace(".py", "")
-
-                # Generate the route path
-                route = "/" + relative_path.replace("\\", "/").replace(".py", "")
-                route = route.replace("index", "").replace("/_", "/").replace("_", "").replace("[", "<").replace("]", ">")
-                if "[...]" in route:
-                    route = route.replace("[...<", "<").replace(">", ":path>")
-
-                # Dynamically load the route module
-                spec = importlib.util.spec_from_file_location(module_path, os.path.join(root, file))
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
-
-                # Register the route
-                if hasattr(module, "handler"):
-                    methods = getattr(module, "methods", ["GET"])
-                    middleware = getattr(module, "middleware", [])
-
-                    # Middleware wrapper
-                    def wrap_handler(handler, middleware):
-                        def wrapped_handler(*args, **kwargs):
-                            for mw in middleware:
-                                mw_response = mw(request)
-                                if mw_response:
-                                    return mw_response
-                            return handler(*args, **kwargs)
-                        return wrapped_handler
-
-                    endpoint = module_path.replace(".", "_")
-                    app.route(route, methods=methods, endpoint=endpoint)(
-                        wrap_handler(module.handler, middleware)
-                    )
-
-                print(f"Registered route: {route}")
+                yield os.path.relpath(os.path.join(root, file), base_path)
+
+
+def route_for_file(relative_path):
+    """Convert a route file path into a URL rule.
+
+    ``[name]`` segments become ``<name>`` (``[int:id]`` keeps its converter),
+    ``[...name]`` becomes a catch-all ``<path:name>``, and an ``index`` file
+    maps to its directory with a trailing slash (``blog/index.py`` is
+    ``/blog/``, and Werkzeug redirects ``/blog`` to it).
+    """
+    path = relative_path.replace("\\", "/")
+    if path.endswith(".py"):
+        path = path[:-3]
+    segments = path.split("/")
+    if segments[-1] == "index":
+        segments[-1] = ""
+    route = "/" + "/".join(segments)
+    route = re.sub(r"\[\.\.\.([^\]]+)\]", r"<path:\1>", route)
+    return re.sub(r"\[([^\]]+)\]", r"<\1>", route)
+
+
+def module_name_for_file(path):
+    return path.replace("/", ".").replace("\\", ".").replace(".py", "")
+
+
+def load_route_module(path, module_name):
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def scan_route_file(base_path, relative_path):
+    """Import a route file and describe it as a manifest entry."""
+    path = os.path.join(base_path, relative_path)
+    module_name = module_name_for_file(path)
+    module = load_route_module(path, module_name)
+    entry = route_entry(
+        path,
+        file=relative_path,
+        rule=route_for_file(relative_path),
+        endpoint=module_name.replace(".", "_"),
+        module=module_name,
+        methods=list(getattr(module, "methods", ["GET"])),
+        handler=hasattr(module, "handler"),
+    )
+    return entry, module
+
+
+def inspect_route_file(base_path, relative_path):
+    """Describe a route file as a manifest entry without importing it.
+
+    Returns None when ``methods`` is not a plain literal, in which case the
+    file has to be imported to know which methods it serves.
+    """
+    path = os.path.join(base_path, relative_path)
+    with open(path, "rb") as f:
+        names = module_names(f.read(), path)
+    methods = ["GET"]
+    if "methods" in names:
+        try:
+            methods = list(literal(names["methods"]))
+        except ValueError:
+            return None
+    module_name = module_name_for_file(path)
+    return route_entry(
+        path,
+        file=relative_path,
+        rule=route_for_file(relative_path),
+        endpoint=module_name.replace(".", "_"),
+        module=module_name,
+        methods=methods,
+        handler="handler" in names,
+    )
+
+
+def describe_route_file(base_path, relative_path):
+    """Describe a route file for ``pypaze routes`` from its source alone.
+
+    ``methods`` or ``middleware`` are None when they aren't written out
+    literally; ``error`` is set when the file doesn't parse.
+    """
+    description = {"file": relative_path, "rule": route_for_file(relative_path),
+                   "methods": ["GET"], "middleware": [], "handler": None}
+    path = os.path.join(base_path, relative_path)
+    try:
+        with open(path, "rb") as f:
+            names = module_names(f.read(), path)
+    except SyntaxError as e:
+        description["error"] = f"{e.msg} (line {e.lineno})"
+        return description
+    if "methods" in names:
+        try:
+            description["methods"] = [str(method).upper() for method in literal(names["methods"])]
+        except ValueError:
+            description["methods"] = None
+    if "middleware" in names:
+        try:
+            description["middleware"] = reference_names(names["middleware"])
+        except ValueError:
+            description["middleware"] = None
+    handler = names.get("handler")
+    if handler is not None:
+        description["handler"] = "async" if isinstance(handler, ast.AsyncFunctionDef) else "sync"
+    return description
+
+
+# Parsing is cheap, so only route trees at least this big are spread over processes
+PARALLEL_MIN_FILES = 64
+
+
+def describe_routes(base_path, workers=None):
+    """Describe every route under base_path without importing its file."""
+    base_path = os.path.abspath(base_path)
+    files = sorted(iter_route_files(base_path))
+    describe = partial(describe_route_file, base_path)
+    if workers == 1 or len(files) < PARALLEL_MIN_FILES:
+        described = [describe(rel) for rel in files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(files) // ((workers or os.cpu_count() or 1) * 4))
+            described = list(pool.map(describe, files, chunksize=chunksize))
+    # Like register_routes, skip helper modules without a handler; files that
+    # don't parse are kept so their errors get reported
+    return [route for route in described if route["handler"] or "error" in route]
+
+
+# Middleware wrapper
+def wrap_handler(handler, middleware):
+    middleware = [(mw, inspect.iscoroutinefunction(mw)) for mw in middleware]
+
+    if inspect.iscoroutinefunction(handler):
+        async def wrapped_handler(*args, **kwargs):
+            for mw, _ in middleware:
+                mw_response = mw(request)
+                if inspect.isawaitable(mw_response):
+                    mw_response = await mw_response
+                if mw_response:
+                    return mw_response
+            return await handler(*args, **kwargs)
+        return wrapped_handler
+
+    def wrapped_handler(*args, **kwargs):
+        for mw, is_async in middleware:
+            mw_response = current_app.async_to_sync(mw)(request) if is_async else mw(request)
+            if mw_response:
+                return mw_response
+        return handler(*args, **kwargs)
+    return wrapped_handler
+
+
+def build_view(app, module, entry):
+    """Wrap a route module's handler in the layers the module and app ask for."""
+    handler = module.handler
+    if getattr(module, "stream_body", None):
+        handler = body_handler(handler, module.stream_body)
+    if getattr(module, "stream", None):
+        handler = stream_handler(handler, module.stream)
+    if getattr(module, "loaders", None):
+        handler = loader_handler(handler, module.loaders)
+    if getattr(module, "cache", None):
+        handler = cache_handler(handler, module.cache)
+    etag = getattr(module, "etag", None)
+    last_modified = getattr(module, "last_modified", None)
+    auto_etag = app.extensions.get("pypaze.auto_etag", False) and etag is not False
+    if callable(etag) or callable(last_modified) or auto_etag:
+        handler = conditional_handler(
+            handler,
+            etag=etag if callable(etag) else None,
+            last_modified=last_modified if callable(last_modified) else None,
+            auto=auto_etag,
+        )
+    middleware = getattr(module, "middleware", [])
+    metrics = app.extensions.get("pypaze.metrics")
+    if metrics is not None and middleware:
+        middleware = timed_middleware(metrics, middleware, entry["rule"])
+    view = wrap_handler(handler, middleware)
+    # Load shedding: the module's own limits plus the app's, unless admission = False
+    admission = app.extensions.get("pypaze.admission")
+    options = getattr(module, "admission", None)
+    if admission is not None and options is not False and (options or admission.limiter):
+        view = admission_view(admission, view, entry["rule"], options or None)
+    # Checked before anything reads the body, and before the request takes a slot
+    max_body_size = getattr(module, "max_body_size", None) or app.config.get("MAX_CONTENT_LENGTH")
+    if max_body_size:
+        view = body_limit_view(view, max_body_size)
+    profiler = app.extensions.get("pypaze.profiler")
+    if profiler is not None:
+        view = profiled_view(profiler, view, entry["rule"], module)
+    if metrics is not None:
+        view = instrument_view(metrics, view, entry["rule"])
+    return view
+
+
+_import_lock = threading.RLock()
+
+
+class RouteView:
+    """Endpoint registered for a route file.
+
+    The route module is imported, and its handler and middleware resolved,
+    on the first call unless a module is passed in up front. Async handlers
+    are awaited directly under ASGI and run through Flask's async_to_sync
+    under WSGI.
+    """
+
+    def __init__(self, app, path, entry, module=None):
+        self.app = app
+        self.path = path
+        self.entry = entry
+        self.module = None
+        self.view = None
+        self.is_async = False
+        self.__name__ = entry["endpoint"]
+        if module is not None:
+            self._bind(module)
+
+    def _bind(self, module):
+        self.module = module
+        self.is_async = inspect.iscoroutinefunction(module.handler)
+        self.view = build_view(self.app, module, self.entry)
+
+    def load(self):
+        if self.view is None:
+            with _import_lock:
+                if self.view is None:
+                    self._bind(load_route_module(self.path, self.entry["module"]))
+        return self.view
+
+    def __call__(self, *args, **kwargs):
+        view = self.view or self.load()
+        if self.is_async:
+            return current_app.async_to_sync(view)(*args, **kwargs)
+        return view(*args, **kwargs)
+
+    async def call_async(self, *args, **kwargs):
+        return await (self.view or self.load())(*args, **kwargs)
+
+
+def register_route(app, view):
+    app.add_url_rule(
+        view.entry["rule"],
+        endpoint=view.entry["endpoint"],
+        view_func=view,
+        methods=view.entry["methods"],
+    )
+    app.extensions.setdefault("pypaze.routes", {})[view.entry["endpoint"]] = view
+
+
+def register_routes(app, base_path, manifest=None, manifest_path=None, lazy=False):
+    """Register every route file under base_path.
+
+    When a manifest from ``pypaze build`` is given, files whose mtime or
+    hash are unchanged reuse their recorded entry and only new or edited
+    files are re-scanned. A refreshed manifest is written back to
+    manifest_path if anything changed.
+
+    With lazy=True route modules are not imported here; each one is loaded
+    by its RouteView on the first request that reaches it.
+    """
+    entries = {}
+    if manifest and manifest.get("base_path") == base_path:
+        entries = {entry["file"]: entry for entry in manifest["routes"]}
+        dirs = manifest.get("dirs", {})
+        stale = [
+            rel for rel, mtime in dirs.items()
+            if not os.path.isdir(os.path.join(base_path, rel))
+            or os.stat(os.path.join(base_path, rel)).st_mtime_ns != mtime
+        ]
+        files = list(iter_route_files(base_path)) if stale else list(entries)
+    else:
+        manifest = None
+        files = list(iter_route_files(base_path))
+
+    changed = manifest is None
+    registered, views = [], {}
+    for relative_path in files:
+        path = os.path.join(base_path, relative_path)
+        entry = entries.get(relative_path)
+        if entry is not None and not os.path.exists(path):
+            changed = True
+            continue
+        module = None
+        recorded_mtime = entry and entry["mtime"]
+        if entry is not None and is_fresh(path, entry):
+            changed = changed or entry["mtime"] != recorded_mtime
+        else:
+            entry = inspect_route_file(base_path, relative_path) if lazy else None
+            if entry is None:
+                entry, module = scan_route_file(base_path, relative_path)
+            changed = True
+        registered.append(entry)
+        if entry["handler"]:
+            views[entry["endpoint"]] = RouteView(app, path, entry, module)
+
+    # Register the routes, most specific first; conflicting files raise
+    # RouteConflictError before anything is added
+    for entry in RouteTree(view.entry for view in views.values()).ordered():
+        view = views[entry["endpoint"]]
+        if not lazy:
+            view.load()
+        register_route(app, view)
+        app.logger.debug("Registered route: %s", entry["rule"])
+
+    if manifest is not None and manifest_path and (changed or len(registered) != len(entries)):
+        # Read-only deployments keep the refreshed entries in memory only
+        try:
+            save_manifest(manifest_path, {
+                "base_path": base_path,
+                "dirs": scan_dirs(base_path),
+                "routes": registered,
+            })
+        except OSError as e:
+            app.logger.debug("Could not update route manifest %s: %s", manifest_path, e)
+    return registered
+
+
+def make_rule(app, entry):
+    """Build the Werkzeug rule app.add_url_rule would create for entry."""
+    methods = {method.upper() for method in entry["methods"]}
+    provide_automatic_options = "OPTIONS" not in methods
+    rule = app.url_rule_class(entry["rule"], methods=methods | {"OPTIONS"}, endpoint=entry["endpoint"])
+    rule.provide_automatic_options = provide_automatic_options
+    return rule
+
+
+def swap_routes(app, removed, views):
+    """Replace the rules of the removed endpoints with rules for views.
+
+    A new url_map is built off to the side and swapped in with a single
+    assignment, so in-flight requests never see a half-updated map.
+    """
+    old_map = app.url_map
+    new_map = app.url_map_class(
+        default_subdomain=old_map.default_subdomain,
+        strict_slashes=old_map.strict_slashes,
+        merge_slashes=old_map.merge_slashes,
+        redirect_defaults=old_map.redirect_defaults,
+        converters=old_map.converters,
+        sort_parameters=old_map.sort_parameters,
+        sort_key=old_map.sort_key,
+        host_matching=old_map.host_matching,
+    )
+    removed = set(removed)
+    registry = app.extensions.setdefault("pypaze.routes", {})
+    # Check the routes that will be live after the swap before touching anything
+    RouteTree(
+        [v.entry for endpoint, v in registry.items() if endpoint not in removed]
+        + [view.entry for view in views]
+    )
+    for rule in old_map.iter_rules():
+        if rule.endpoint not in removed:
+            new_rule = rule.empty()
+            new_rule.provide_automatic_options = getattr(rule, "provide_automatic_options", False)
+            new_map.add(new_rule)
+    for view in views:
+        new_map.add(make_rule(app, view.entry))
+
+    for view in views:
+        app.view_functions[view.entry["endpoint"]] = view
+    app.url_map = new_map
+    for endpoint in removed - {view.entry["endpoint"] for view in views}:
+        app.view_functions.pop(endpoint, None)
+        registry.pop(endpoint, None)
+    for view in views:
+        registry[view.entry["endpoint"]] = view
+
+
+def reload_route_files(app, base_path, relative_paths, lazy=False):
+    """Re-register only the routes owned by the given files or directories.
+
+    Paths that no longer exist have their routes removed; a directory stands
+    for every route file below it. Returns the number of routes swapped in.
+    """
+    registry = app.extensions.get("pypaze.routes", {})
+    owned = {}
+    for endpoint, view in registry.items():
+        owned.setdefault(view.entry["file"], []).append(endpoint)
+
+    files = set()
+    for rel in relative_paths:
+        prefix = rel.rstrip(os.sep) + os.sep
+        files.update(f for f in owned if f == rel or f.startswith(prefix))
+        path = os.path.join(base_path, rel)
+        if os.path.isdir(path):
+            files.update(os.path.join(rel, f) for f in iter_route_files(path))
+        elif rel.endswith(".py") and os.path.basename(rel) != "__init__.py" and rel != LIFECYCLE_FILE:
+            files.add(rel)
+
+    removed, views = [], []
+    for rel in sorted(files):
+        removed.extend(owned.get(rel, []))
+        path = os.path.join(base_path, rel)
+        if not os.path.exists(path):
+            continue
+        module = None
+        entry = inspect_route_file(base_path, rel) if lazy else None
+        if entry is None:
+            entry, module = scan_route_file(base_path, rel)
+        if entry["handler"]:
+            view = RouteView(app, path, entry, module)
+            if not lazy:
+                view.load()
+            views.append(view)
+
+    swap_routes(app, removed, views)
+    return len(views)
+
+
+def warm_routes(app, routes):
+    """Import the given routes ahead of their first request.
+
+    Each item may be a URL rule, an endpoint or a route file path.
+    """
+    wanted = set(routes)
+    for endpoint, view in app.extensions.get("pypaze.routes", {}).items():
+        if wanted & {endpoint, view.entry["rule"], view.entry["file"]}:
+            view.load()
+
+
+def build_manifest(base_path):
+    """Scan every route file under base_path into a manifest dict."""
+    base_path = os.path.abspath(base_path)
+    routes = [scan_route_file(base_path, rel)[0] for rel in iter_route_files(base_path)]
+    return {"base_path": base_path, "dirs": scan_dirs(base_path), "routes": routes}
@@ -0,0 +1,147 @@
+import inspect
+import json
+from flask import current_app, has_request_context, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.wrappers import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Streamed records are buffered up to this many bytes per chunk, so
+# compression isn't flushed after every record
+STREAM_CHUNK_SIZE = 16 * 1024
+STREAM_FORMATS = {"json": "application/json", "ndjson": "application/x-ndjson"}
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, encoding with orjson when it is installed.
+
+    Output is the same JSON as the default provider's: keys are sorted
+    unless ``sort_keys`` is turned off, dates are HTTP dates, and anything
+    else orjson doesn't know, dataclasses included, goes through
+    ``default``. Values orjson can't encode at all, such as integers wider
+    than 64 bits, fall back to the standard library, as does parsing input
+    with ``NaN`` or ``Infinity`` in it. Two things differ from the default provider with
+    orjson installed: NaN and infinite floats are written as ``null``
+    (valid JSON, unlike the standard library's ``NaN``), and non-ASCII
+    characters are written as UTF-8 rather than ``\\u`` escapes.
+    Responses are built from bytes without an intermediate str.
+    """
+
+    # Match orjson's UTF-8 output in the fallback; without orjson, keep Flask's
+    ensure_ascii = orjson is None
+
+    def _options(self, indent):
+        # Dataclasses go through default too, so their keys are sorted like a dict's
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def _indent(self):
+        return self.compact is False or (self.compact is None and self._app.debug)
+
+    def encode(self, obj, indent=False):
+        """Encode obj to UTF-8 JSON bytes."""
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=self.default, option=self._options(indent))
+            except orjson.JSONEncodeError:
+                pass
+        kwargs = {"indent": 2} if indent else {"separators": (",", ":")}
+        return json.dumps(obj, default=self.default, ensure_ascii=self.ensure_ascii,
+                          sort_keys=self.sort_keys, **kwargs).encode()
+
+    def dumps(self, obj, **kwargs):
+        if kwargs or orjson is None:
+            return super().dumps(obj, **kwargs)
+        return self.encode(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs or orjson is None:
+            return super().loads(s, **kwargs)
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            # The standard library also accepts NaN and Infinity
+            return super().loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.encode(obj, self._indent()) + b"\n", mimetype=self.mimetype)
+
+
+def install_json(app, provider=None):
+    app.json = (provider or FastJSONProvider)(app)
+
+
+def _encoder(provider):
+    if isinstance(provider, FastJSONProvider):
+        return provider.encode
+    return lambda obj: provider.dumps(obj, separators=(",", ":")).encode()
+
+
+def _chunks(records, encode, ndjson, chunk_size):
+    buffer = bytearray() if ndjson else bytearray(b"[")
+    first = True
+    try:
+        for record in records:
+            if not (ndjson or first):
+                buffer += b","
+            buffer += encode(record)
+            if ndjson:
+                buffer += b"\n"
+            first = False
+            if len(buffer) >= chunk_size:
+                yield bytes(buffer)
+                buffer.clear()
+    finally:
+        if hasattr(records, "close"):
+            records.close()
+    if not ndjson:
+        buffer += b"]\n"
+    if buffer:
+        yield bytes(buffer)
+
+
+def stream_json(records, format="json", chunk_size=STREAM_CHUNK_SIZE):
+    """Stream an iterable of records as a JSON array or as NDJSON.
+
+    Records are encoded one at a time with the app's JSON provider as the
+    response is sent, so memory use doesn't grow with the number of
+    records. The request context stays available to the iterable.
+    """
+    if format not in STREAM_FORMATS:
+        raise ValueError(f"Unknown stream format {format!r}, expected one of {', '.join(STREAM_FORMATS)}")
+    body = _chunks(iter(records), _encoder(current_app.json), format == "ndjson", chunk_size)
+    if has_request_context():
+        body = stream_with_context(body)
+    return current_app.response_class(body, mimetype=STREAM_FORMATS[format])
+
+
+def _streamed(rv, format):
+    """rv with a bare iterator of records, as returned by a handler, turned into a stream."""
+    body, rest = (rv[0], rv[1:]) if isinstance(rv, tuple) and rv else (rv, ())
+    if isinstance(body, (str, bytes, dict, list, tuple, Response)) or not hasattr(body, "__iter__"):
+        return rv
+    response = stream_json(body, format)
+    return (response,) + rest if rest else response
+
+
+def stream_handler(handler, format):
+    """Stream the iterators a route module's handler returns in its ``stream`` format."""
+    if format not in STREAM_FORMATS:
+        raise ValueError(f"Unknown stream format {format!r}, expected one of {', '.join(STREAM_FORMATS)}")
+
+    if inspect.iscoroutinefunction(handler):
+        async def streaming_handler(*args, **kwargs):
+            return _streamed(await handler(*args, **kwargs), format)
+        return streaming_handler
+
+    def streaming_handler(*args, **kwargs):
+        return _streamed(handler(*args, **kwargs), format)
+    return streaming_handler
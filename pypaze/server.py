@@ -0,0 +1,380 @@
+import gc
+import importlib
+import os
+import random
+import select
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from werkzeug.wsgi import FileWrapper
+
+
+def rss_bytes():
+    """Current resident memory of this process, in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def import_app(path):
+    """Return a loader for the app at ``module:attribute`` (attribute defaults to app).
+
+    The module is re-imported on every call so a reload picks up new code.
+    """
+    module_name, _, attr = path.partition(":")
+
+    def load():
+        if os.getcwd() not in sys.path:
+            sys.path.insert(0, os.getcwd())
+        sys.modules.pop(module_name, None)
+        return getattr(importlib.import_module(module_name), attr or "app")
+    return load
+
+
+class SendfileWrapper(FileWrapper):
+    """``wsgi.file_wrapper`` that sends files with socket.sendfile.
+
+    The first iteration yields an empty chunk so the server writes the
+    headers; the body then goes from the file to the socket without passing
+    through Python. Range requests seek first and fall back to reading.
+    """
+
+    def __init__(self, handler, file, buffer_size=8192):
+        super().__init__(file, buffer_size)
+        self.handler = handler
+        self.headers_sent = False
+        try:
+            file.fileno()
+            self.sendfile = True
+        except (AttributeError, OSError, ValueError):
+            self.sendfile = False
+
+    def seek(self, *args):
+        self.sendfile = False
+        super().seek(*args)
+
+    def __next__(self):
+        if not self.sendfile:
+            return super().__next__()
+        if not self.headers_sent:
+            self.headers_sent = True
+            return b""
+        self.sendfile = False
+        self.handler.connection.sendfile(self.file)
+        raise StopIteration()
+
+
+class RequestHandler(WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Idle keep-alive connections give their thread back after this long
+    timeout = 5
+
+    def make_environ(self):
+        environ = super().make_environ()
+        environ["wsgi.file_wrapper"] = partial(SendfileWrapper, self)
+        environ["pypaze.early_hints"] = self.send_early_hints
+        return environ
+
+    def send_early_hints(self, links):
+        """Send a 103 Early Hints response with links ahead of the real one."""
+        # HTTP/1.0 clients may take an informational response for the final one
+        if self.request_version != "HTTP/1.1":
+            return
+        hints = "".join(f"Link: {link}\r\n" for link in links)
+        self.wfile.write(f"HTTP/1.1 103 Early Hints\r\n{hints}\r\n".encode("latin-1"))
+
+    # Requests handled on this connection
+    served = 0
+
+    def handle_one_request(self):
+        # Cleared first, so a read that times out isn't counted as a request
+        self.raw_requestline = b""
+        super().handle_one_request()
+        if not self.raw_requestline:
+            return
+        self.served += 1
+        # The first request on a connection is counted when it's accepted
+        if self.served > 1:
+            self.server.count_request()
+        if self.server.served_max_requests():
+            self.close_connection = True
+
+    def log_request(self, code="-", size="-"):
+        pass
+
+
+class WorkerServer(BaseWSGIServer):
+    """WSGI server for one pre-forked worker.
+
+    Accepts from the listening socket inherited from the arbiter and hands
+    each connection to a fixed-size thread pool. A connection is only
+    accepted when a thread is free, so idle workers pick up the slack.
+    ``max_requests`` counts requests, so keep-alive connections still
+    retire the worker, and the connection that reaches it is closed.
+    """
+
+    multithread = True
+    multiprocess = True
+
+    def __init__(self, app, fd, threads=4, max_requests=0, max_memory=0):
+        super().__init__("0.0.0.0", 0, app, handler=RequestHandler, fd=fd)
+        self.alive = True
+        self.connections = 0
+        self.requests = 0
+        self._count_lock = threading.Lock()
+        self.max_requests = max_requests
+        self.max_memory = max_memory
+        self.timeout = 1.0
+        self._slots = threading.BoundedSemaphore(threads)
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="pypaze-worker")
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        self.count_request()
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def count_request(self):
+        with self._count_lock:
+            self.requests += 1
+
+    def served_max_requests(self):
+        return bool(self.max_requests) and self.requests >= self.max_requests
+
+    def should_retire(self):
+        if self.served_max_requests():
+            return True
+        return bool(self.max_memory) and rss_bytes() > self.max_memory
+
+    def run(self):
+        while self.alive:
+            if not self._slots.acquire(timeout=self.timeout):
+                continue
+            accepted = self.connections
+            self.handle_request()
+            if self.connections == accepted:
+                self._slots.release()
+            if self.should_retire():
+                self.alive = False
+        self._pool.shutdown(wait=True)
+        self.socket.close()
+
+
+class Arbiter:
+    """Pre-fork process manager behind ``pypaze serve``.
+
+    The app is built once in the arbiter, then each worker is forked from
+    it so route modules are shared copy-on-write. Workers that exit (max
+    requests, max memory, crash) are replaced. SIGHUP rebuilds the app and
+    rolls the workers over without closing the listening socket; SIGTERM
+    and SIGINT shut down gracefully.
+    """
+
+    def __init__(self, load_app, host="127.0.0.1", port=8000, workers=None, threads=4,
+                 max_requests=0, max_memory=0, graceful_timeout=30, backlog=2048):
+        self.load_app = load_app
+        self.host = host
+        self.port = port
+        self.num_workers = workers or os.cpu_count() or 1
+        self.threads = threads
+        self.max_requests = max_requests
+        self.max_memory = max_memory
+        self.graceful_timeout = graceful_timeout
+        self.backlog = backlog
+        self.workers = {}
+        self.retiring = {}
+        self.generation = 0
+        self.signals = []
+
+    def run(self):
+        if not hasattr(os, "fork"):
+            raise RuntimeError("pypaze serve needs a platform with os.fork")
+        # Workers share metrics through snapshot files in this directory
+        self.metrics_dir = None
+        if not os.environ.get("PYPAZE_METRICS_DIR"):
+            self.metrics_dir = os.environ["PYPAZE_METRICS_DIR"] = tempfile.mkdtemp(prefix="pypaze-metrics-")
+        self.app = self._build_app()
+        self._freeze()
+        self.sock = socket.create_server((self.host, self.port), backlog=self.backlog)
+        # Workers race to accept; the losers must not block in accept()
+        self.sock.setblocking(False)
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_w, False)
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(sig, self._on_signal)
+        print(f"pypaze serving on http://{self.host}:{self.port} with {self.num_workers} workers")
+
+        self.spawn_workers()
+        try:
+            while True:
+                sig = self.signals.pop(0) if self.signals else None
+                if sig in (signal.SIGTERM, signal.SIGINT):
+                    break
+                if sig == signal.SIGHUP:
+                    self.reload()
+                self.reap_workers()
+                self.spawn_workers()
+                self.kill_stragglers()
+                if not self.signals:
+                    select.select([self._wake_r], [], [], 1.0)
+                    try:
+                        os.read(self._wake_r, 64)
+                    except BlockingIOError:
+                        pass
+        finally:
+            self.stop()
+
+    def _on_signal(self, sig, frame):
+        if sig != signal.SIGCHLD:
+            self.signals.append(sig)
+        try:
+            os.write(self._wake_w, b"\0")
+        except OSError:
+            pass
+
+    def _build_app(self):
+        return self.load_app()
+
+    def _freeze(self):
+        # Keep objects created at startup out of the GC's reach so collections
+        # in workers don't touch, and un-share, their memory pages
+        gc.collect()
+        if hasattr(gc, "freeze"):
+            gc.freeze()
+
+    def shutdown_app(self, app):
+        lifecycle = app.extensions.get("pypaze.lifecycle")
+        if lifecycle is not None:
+            lifecycle.shutdown()
+
+    def spawn_workers(self):
+        current = [pid for pid, gen in self.workers.items() if gen == self.generation]
+        for _ in range(self.num_workers - len(current)):
+            self.spawn_worker()
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = self.generation
+            return pid
+        # Worker process: never returns
+        status = 0
+        try:
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            random.seed()
+            lifecycle = self.app.extensions.get("pypaze.lifecycle")
+            if lifecycle is not None:
+                lifecycle.post_fork()
+            server = WorkerServer(
+                self.app, self.sock.fileno(), threads=self.threads,
+                max_requests=self._jittered(self.max_requests), max_memory=self.max_memory,
+            )
+
+            def stop(sig, frame):
+                server.alive = False
+
+            signal.signal(signal.SIGTERM, stop)
+            signal.signal(signal.SIGINT, stop)
+            try:
+                server.run()
+            finally:
+                # os._exit skips atexit, so shut the app down here
+                if lifecycle is not None:
+                    lifecycle.shutdown()
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _jittered(self, max_requests):
+        # Spread restarts out so workers don't all recycle at once
+        return max_requests + random.randint(0, max_requests // 10) if max_requests else 0
+
+    def reap_workers(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            self.workers.pop(pid, None)
+            self.retiring.pop(pid, None)
+
+    def reload(self):
+        print("Reloading workers...")
+        # The current app was frozen at startup or the last reload; unfreeze it
+        # so it can be collected once replaced
+        if hasattr(gc, "unfreeze"):
+            gc.unfreeze()
+        try:
+            app = self._build_app()
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            print("Reload failed; still serving the current app.")
+            self._freeze()
+            return
+        old_app, self.app = self.app, app
+        # Workers are separate processes, so the arbiter's copy can go now
+        self.shutdown_app(old_app)
+        del old_app
+        self._freeze()
+        old = [pid for pid, gen in self.workers.items() if gen == self.generation]
+        self.generation += 1
+        self.spawn_workers()
+        self.retire(old)
+
+    def retire(self, pids):
+        deadline = time.monotonic() + self.graceful_timeout
+        for pid in pids:
+            self.retiring[pid] = deadline
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def kill_stragglers(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now > deadline:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def stop(self):
+        self.retire(list(self.workers))
+        while self.workers:
+            self.reap_workers()
+            self.kill_stragglers()
+            time.sleep(0.1)
+        self.sock.close()
+        self.shutdown_app(self.app)
+        if self.metrics_dir:
+            shutil.rmtree(self.metrics_dir, ignore_errors=True)
+        print("pypaze server stopped.")
@@ -0,0 +1,184 @@
+import queue
+import threading
+import time
+from flask import current_app, g, has_request_context
+from .process import PerProcess
+
+# Put on the queue once per worker thread to stop it
+_STOP = object()
+
+
+def _name(fn):
+    return getattr(fn, "__qualname__", None) or repr(fn)
+
+
+class _Task:
+    __slots__ = ("fn", "args", "kwargs", "queued")
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.queued = None
+
+
+class TaskQueue(PerProcess):
+    """Bounded pool that runs deferred work after responses are sent.
+
+    Tasks run on ``workers`` threads in an app context. When ``max_queue``
+    tasks are already waiting, submitting blocks for up to ``put_timeout``
+    seconds, which slows down the request threads that keep adding work,
+    and then gives the task up. A task that raises is retried ``retries``
+    times with exponential backoff from ``retry_delay`` seconds; one that
+    still fails, or is given up, is logged and passed to ``dead_letter(fn,
+    args, kwargs, exc)`` if set. With ``sync=True`` tasks run as soon as
+    they are deferred, on the calling thread, which is what tests want.
+    """
+
+    def __init__(self, workers=4, max_queue=1000, put_timeout=1.0, retries=2, retry_delay=0.1,
+                 dead_letter=None, sync=False, drain_timeout=10.0):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.dead_letter = dead_letter
+        self.sync = sync
+        self.drain_timeout = drain_timeout
+        self.app = None
+        self.metrics = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _start_process(self):
+        self._queue = queue.Queue(self.max_queue)
+        self._threads = [
+            threading.Thread(target=self._run, name=f"pypaze-task-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        self._closed = False
+
+    def depth(self):
+        """Tasks waiting in this process."""
+        return self._queue.qsize() if self._started() else 0
+
+    def submit(self, fn, *args, **kwargs):
+        task = _Task(fn, args, kwargs)
+        if self.sync:
+            self._execute(task)
+            return
+        self._ensure_started()
+        if self._closed:
+            self._fail(task, RuntimeError("Task queue is shut down"), "dropped")
+            return
+        task.queued = time.perf_counter()
+        try:
+            self._queue.put(task, timeout=self.put_timeout)
+        except queue.Full:
+            self._fail(task, RuntimeError(f"Task queue full ({self.max_queue} waiting)"), "dropped")
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is _STOP:
+                return
+            if self.metrics is not None:
+                self.metrics.observe("pypaze_task_queue_seconds", (("task", _name(task.fn)),),
+                                     time.perf_counter() - task.queued)
+            self._execute(task)
+
+    def _execute(self, task):
+        with self.app.app_context():
+            for attempt in range(self.retries + 1):
+                start = time.perf_counter()
+                try:
+                    task.fn(*task.args, **task.kwargs)
+                except Exception as e:
+                    self._record(task, "retried" if attempt < self.retries else None, start)
+                    if attempt == self.retries:
+                        self._fail(task, e, "failed")
+                        return
+                    time.sleep(self.retry_delay * 2 ** attempt)
+                else:
+                    self._record(task, "ok", start)
+                    return
+
+    def _record(self, task, outcome, start):
+        if self.metrics is None:
+            return
+        labels = (("task", _name(task.fn)),)
+        self.metrics.observe("pypaze_task_duration_seconds", labels, time.perf_counter() - start)
+        if outcome is not None:
+            self.metrics.inc("pypaze_tasks_total", labels + (("outcome", outcome),))
+
+    def _fail(self, task, exc, outcome):
+        if self.metrics is not None:
+            self.metrics.inc("pypaze_tasks_total", (("task", _name(task.fn)), ("outcome", outcome)))
+        self.app.logger.error("Deferred task %s %s: %s", _name(task.fn), outcome, exc, exc_info=exc)
+        if self.dead_letter is not None:
+            try:
+                self.dead_letter(task.fn, task.args, task.kwargs, exc)
+            except Exception:
+                self.app.logger.exception("Dead letter handler for %s failed", _name(task.fn))
+
+    def shutdown(self, timeout=None):
+        """Stop taking tasks and wait up to timeout seconds for queued ones to finish.
+
+        Tasks still waiting after that are dead-lettered.
+        """
+        if not self._started() or self._closed:
+            return
+        self._closed = True
+        deadline = time.monotonic() + (self.drain_timeout if timeout is None else timeout)
+        for _ in self._threads:
+            try:
+                self._queue.put(_STOP, timeout=max(0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        while True:
+            try:
+                task = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if task is not _STOP:
+                self._fail(task, RuntimeError("Not run before shutdown"), "dropped")
+
+
+def defer(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) on the app's task queue.
+
+    During a request the task is queued once the response has been sent;
+    elsewhere it is queued straight away. It runs in an app context, but
+    the request is gone by then, so pass it what it needs.
+    """
+    tasks = current_app.extensions["pypaze.tasks"]
+    if has_request_context() and not tasks.sync:
+        g.setdefault("_pypaze_deferred", []).append((fn, args, kwargs))
+    else:
+        tasks.submit(fn, *args, **kwargs)
+
+
+def install_tasks(app, tasks):
+    tasks.app = app
+    tasks.metrics = app.extensions.get("pypaze.metrics")
+    app.extensions["pypaze.tasks"] = tasks
+    # Drained before resources are closed, since tasks may still use them
+    app.extensions["pypaze.lifecycle"].on("shutdown", lambda app: tasks.shutdown())
+    if tasks.metrics is not None:
+        tasks.metrics.collectors.append(lambda: [("gauges", "pypaze_tasks_queued", (), tasks.depth())])
+
+    @app.after_request
+    def queue_deferred_tasks(response):
+        deferred = g.pop("_pypaze_deferred", None)
+        if deferred:
+            def submit_all():
+                for fn, args, kwargs in deferred:
+                    tasks.submit(fn, *args, **kwargs)
+
+            # Runs once the server has finished sending the body
+            response.call_on_close(submit_all)
+        return response
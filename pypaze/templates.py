@@ -0,0 +1,74 @@
+import os
+from jinja2 import FileSystemBytecodeCache, TemplateSyntaxError
+from .manifest import BUILD_DIR
+
+
+def default_bytecode_dir(template_folder):
+    """Bytecode cache for a template folder: <project>/.pypaze/jinja."""
+    project = os.path.dirname(os.path.abspath(template_folder))
+    return os.path.join(project, BUILD_DIR, "jinja")
+
+
+class BytecodeCache(FileSystemBytecodeCache):
+    """FileSystemBytecodeCache that compiles without caching when it can't write.
+
+    A cache directory left by another user, or a full disk, would otherwise
+    make every cache miss fail the render.
+    """
+
+    def dump_bytecode(self, bucket):
+        try:
+            super().dump_bytecode(bucket)
+        except OSError:
+            pass
+
+
+def configure_bytecode_cache(app, cache_dir):
+    """Persist compiled templates in cache_dir so new workers skip compiling them.
+
+    Must run before the app's Jinja environment is first used. Entries are
+    keyed by the template's source checksum, so edited templates never load
+    stale bytecode. Read-only deployments without a cache directory skip it,
+    and ones where it can't be written to only read from it.
+    """
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError:
+        return
+    app.jinja_options = dict(app.jinja_options, bytecode_cache=BytecodeCache(cache_dir))
+
+
+def compile_templates(app):
+    """Load every template into the environment's cache (and the bytecode cache).
+
+    Returns the number of templates compiled and a list of
+    (name, lineno, message) for those with syntax errors.
+    """
+    env = app.jinja_env
+    compiled, errors = 0, []
+    for name in env.list_templates():
+        try:
+            env.get_template(name)
+        except TemplateSyntaxError as e:
+            errors.append((name, e.lineno, e.message))
+        else:
+            compiled += 1
+    return compiled, errors
+
+
+def invalidate_template(app, name):
+    """Drop one template from the in-memory cache so its next render reloads it.
+
+    Templates extending or including it look it up by name when rendering,
+    so they don't need to be recompiled.
+    """
+    cache = app.jinja_env.cache
+    if cache is None:
+        return 0
+    keys = [key for key in cache.keys() if key[1] == name]
+    for key in keys:
+        try:
+            del cache[key]
+        except KeyError:
+            pass
+    return len(keys)
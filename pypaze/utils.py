@@ -1,21 +1,86 @@
+import os
+import threading
+import time
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+from .routing import reload_route_files
+from .templates import invalidate_template
 
 class RouteChangeHandler(FileSystemEventHandler):
+    """Re-register the routes owned by changed files.
+
+    Editors often write a file several times per save, so events are
+    debounced per path and each path is reloaded once things go quiet.
+    """
+
+    def __init__(self, app, base_path, lazy=False, delay=0.1):
+        self.app = app
+        self.base_path = os.path.abspath(base_path)
+        self.lazy = lazy
+        self.delay = delay
+        self._timers = {}
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+    def on_any_event(self, event):
+        if event.event_type not in ("created", "modified", "deleted", "moved"):
+            return
+        # A directory's own "modified" event just echoes changes to its files
+        if event.is_directory and event.event_type == "modified":
+            return
+        for path in (event.src_path, getattr(event, "dest_path", "")):
+            if not path or "__pycache__" in path:
+                continue
+            rel = os.path.relpath(os.fsdecode(path), self.base_path)
+            if rel != "." and not rel.startswith("..") and (event.is_directory or rel.endswith(".py")):
+                self._schedule(rel)
+
+    def _schedule(self, rel):
+        with self._lock:
+            timer = self._timers.pop(rel, None)
+            if timer is not None:
+                timer.cancel()
+            timer = threading.Timer(self.delay, self._reload, (rel,))
+            timer.daemon = True
+            self._timers[rel] = timer
+            timer.start()
+
+    def _reload(self, rel):
+        with self._lock:
+            self._timers.pop(rel, None)
+        with self._reload_lock:
+            start = time.perf_counter()
+            try:
+                count = reload_route_files(self.app, self.base_path, [rel], lazy=self.lazy)
+            except Exception as e:
+                print(f"Route reload failed for {rel}: {e!r}")
+                return
+        print(f"Reloaded {rel} ({count} routes) in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+class TemplateChangeHandler(FileSystemEventHandler):
+    """Evict changed templates from the Jinja cache, leaving the rest compiled."""
+
     def __init__(self, app):
         self.app = app
+        self.template_folder = app.template_folder
 
-    def on_modified(self, event):
-        if event.src_path.endswith(".py"):
-            print(f"Route changed: {event.src_path}. Reloading routes...")
-            with self.app.app_context():
-                self.app.url_map._rules.clear()
-                from .routing import register_routes
-                register_routes(self.app)
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in ("created", "modified", "deleted", "moved"):
+            return
+        for path in (event.src_path, getattr(event, "dest_path", "")):
+            if not path:
+                continue
+            name = os.path.relpath(os.fsdecode(path), self.template_folder).replace(os.sep, "/")
+            if not name.startswith("..") and invalidate_template(self.app, name):
+                print(f"Reloaded template {name}")
 
-def enable_hot_reload(app, watch_path):
+def enable_hot_reload(app, watch_path, lazy=False):
     observer = Observer()
-    handler = RouteChangeHandler(app)
+    handler = RouteChangeHandler(app, watch_path, lazy=lazy)
     observer.schedule(handler, path=watch_path, recursive=True)
+    if app.template_folder and os.path.isdir(app.template_folder):
+        observer.schedule(TemplateChangeHandler(app), path=app.template_folder, recursive=True)
+    observer.daemon = True
     observer.start()
     print("Hot-reloading enabled for routes.")
+    return observer
@@ -12,11 +12,15 @@ setup(
     packages=find_packages(),  # Automatically discover packages in your project
     include_package_data=True,  # Include non-Python files like templates, static, etc.
     install_requires=[
-        "Flask",  # Add any dependencies your framework requires
+        "Flask>=3.1",  # per-request body limits need a settable request.max_content_length
         "watchdog",  # For hot-reloading support
         "click",
         "pathlib",
     ],
+    extras_require={
+        "async": ["asgiref>=3.2"],  # async handlers under WSGI servers
+        "asgi": ["uvicorn"],  # pypaze run --asgi
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",